@@ -55,7 +55,7 @@ function array(a) {
     this.pop = function () {
         if (this.length == 0) return;
 
-        i = 1*this.length-1
+        i = this.length - 1
         e = this[i]
         this[i] = 0
         this.length = i
@@ -83,7 +83,7 @@ function array(a) {
         if (i < 0 || i >= this.length) return;
 
         e = this[i]
-        this.length = 1*this.length - 1
+        this.length = this.length - 1
 
         for (n = i; n < this.length; n++) {
             this[n] = this[1*n+1]
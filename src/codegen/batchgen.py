@@ -10,29 +10,175 @@ from .codegenerator import code_emitter, CodeGenerator
 
 from parsing import syntax
 
-from semantics.scope    import Scope
-from semantics.variable import INT, STR, Variable
+from semantics.binder    import FUNCTION, VARIABLE
+from semantics.inference import always_returns, direct_callee
+from semantics.scope     import Scope
+from semantics.variable  import INT, STR, Variable
 
-from lexing.lexer  import Lexer
-from lexing.source import StringSource
+#--------------------------------------------------
+# CONSTANTS
+#--------------------------------------------------
 
-from parsing.parser import Parser
+EXPR = 'expression'
+REF  = 'reference'
+TEST = 'test'
+VAR  = 'variable'
+
+# Prefixes of the names of variables stored in the frame of the current call
+# and of top-level variables (the top level is called with zero as its id).
+FRAME   = '__c_%~2__.'
+GLOBALS = '__c_0__.'
 
 #--------------------------------------------------
-# CONSTANTS
+# FUNCTIONS
 #--------------------------------------------------
 
-REF = 'reference'
-VAR = 'variable'
+def is_closure_var(var):
+    # Variables declared by assignments are stored in the closure of the
+    # function declaring them.  Parameters and named functions aren't.
+    return isinstance(var.name, str) and var.name.startswith(FRAME)
+
+def negate(test):
+    if test.startswith('not '):
+        return test[4:]
+
+    return 'not ' + test
+
+def boolean_ternary(node):
+    # Whether a ?: with 0 and 1 as its values, like the ones ! is parsed
+    # into, has the value of its condition (True) or the opposite (False).
+    # None for anything else.
+    if node.construct != syntax.IF_TERNARY:
+        return None
+
+    a = node.children[1]
+    b = node.children[2]
+    if a.construct != syntax.INTEGER or b.construct != syntax.INTEGER:
+        return None
+
+    if (a.data, b.data) == (1, 0):
+        return True
+    if (a.data, b.data) == (0, 1):
+        return False
+
+    return None
+
+def and_operands(node):
+    if node.construct != syntax.LOGIC_AND:
+        return [node]
+
+    return and_operands(node.children[0]) + and_operands(node.children[1])
+
+def local_symbols(func):
+    # The symbols of the variables declared in the function, in the order they
+    # appear.  Nested functions only use them if they are captured.
+    symbols = []
+
+    stack = list(reversed(func.children[1].children))
+    while stack:
+        node = stack.pop()
+        if node.construct == syntax.FUNC:
+            continue
+
+        if node.construct == syntax.IDENTIFIER and node.binding:
+            symbol = node.binding.symbol
+            if symbol.kind == VARIABLE and symbol.owner is func and symbol not in symbols:
+                symbols.append(symbol)
+
+        if node.children:
+            stack.extend(reversed(node.children))
+
+    return symbols
+
+def expr_reads(func, node, assigned, reads):
+    # Adds the variables of the function that the expression can read before
+    # they are assigned to reads, then those it always assigns to assigned.
+    # Variables assigned in the expression count as unassigned all through it.
+    new = []
+
+    stack = [(node, True)]
+    while stack:
+        node, always = stack.pop()
+        c = node.construct
+
+        if c == syntax.FUNC:
+            continue
+
+        children = node.children or []
+
+        if c == syntax.IDENTIFIER and node.binding:
+            symbol = node.binding.symbol
+            if symbol.kind == VARIABLE and symbol.owner is func and symbol not in assigned:
+                reads.add(symbol)
+        elif c == syntax.ASSIGN and children[0].construct == syntax.IDENTIFIER:
+            if always and children[0].binding:
+                new.append(children[0].binding.symbol)
+
+            children = children[1:]
+        elif c in (syntax.IF_TERNARY, syntax.LOGIC_AND, syntax.LOGIC_OR):
+            # Only the first operand is always evaluated.
+            stack.extend((child, False) for child in children[1:])
+            children = children[:1]
+
+        stack.extend((child, always) for child in children)
+
+    assigned.update(new)
+
+def block_reads(func, nodes, assigned, reads):
+    # Like expr_reads(), for statements.
+    for node in nodes:
+        c = node.construct
+
+        if c == syntax.FUNC:
+            continue
+
+        if c == syntax.IF:
+            expr_reads(func, node.children[0], assigned, reads)
+
+            a = set(assigned)
+            b = set(assigned)
+            block_reads(func, node.children[1].children or [], a, reads)
+            block_reads(func, node.children[2].children or [], b, reads)
+
+            assigned.update(a & b)
+        elif c == syntax.WHILE:
+            # Loops may not run at all.
+            expr_reads(func, node.children[0], assigned, reads)
+            block_reads(func, node.children[1:], set(assigned), reads)
+        elif c == syntax.FOR:
+            expr_reads(func, node.children[0], assigned, reads)
+            expr_reads(func, node.children[1], assigned, reads)
+
+            body = set(assigned)
+            block_reads(func, node.children[3:], body, reads)
+            expr_reads(func, node.children[2], body, reads)
+        else:
+            expr_reads(func, node, assigned, reads)
+
+def unassigned_reads(func):
+    # The variables of the function that it can read before assigning them.
+    reads = set()
+    block_reads(func, func.children[1].children, set(), reads)
+
+    return reads
 
 #--------------------------------------------------
 # CLASSES
 #--------------------------------------------------
 
 class Batch(CodeGenerator):
-    def __init__(self, ast):
+    def __init__(self, ast, modules):
         super(Batch, self).__init__(ast)
 
+        self.modules = modules
+
+        # Optimizes the generated lines, if set.
+        self.peephole = None
+
+        # How variables are looked up by name: 'for' expands them through the
+        # variable of a for loop, 'call' has call set parse the line again.
+        self.indirection = 'for'
+
         self.label_counter = 0
         self.tempvar_counter = 0
         self.value_stack = []
@@ -40,6 +186,33 @@ class Batch(CodeGenerator):
         self.loop_labels = []
         self.includes = []
 
+        # The labels and parameters of the functions we are in that make tail
+        # calls (innermost last).
+        self.tail_funcs = []
+
+        # The functions we are in that recurse on a stack of their own: their
+        # symbols, return labels, result variables and variables to save.
+        # Their code jumps to labels instead of using blocks, since labels in
+        # blocks can't be jumped to.
+        self.deep_funcs = []
+        self.flat = False
+
+        # Prefixes of temporary variables in the functions we are in.
+        self.prefixes = [FRAME]
+
+        # The temporary variables in use (prefixes and names, newest last),
+        # and the names free to use again by prefix.
+        self.temps = []
+        self.free_temps = {}
+
+        # The number of temporary variables asked for, and of names created
+        # for them.
+        self.num_temps = 0
+        self.num_temp_names = 0
+
+        # Variables by the symbols the binder resolved identifiers to.
+        self.variables = {}
+
         self.segments = collections.OrderedDict((
             ('preinit' , ''),
             ('init', ''),
@@ -63,19 +236,23 @@ class Batch(CodeGenerator):
         if s in self.includes:
             return
 
-        f = open(s)
-        s = f.read()
-        f.close()
+        # Marked before generating code so that include cycles end here.
+        self.includes.append(s)
 
-        p = Parser(Lexer(StringSource(s)))
-        ast = p.generate_ast()
-        b = Batch(ast)
+        # The tree has already been analyzed and optimized.
+        ast = self.modules.load(s).tree
+        b = Batch(ast, self.modules)
+        b.indirection = self.indirection
         b.scope = self.scope
+        b.includes = self.includes
+        b.variables = self.variables
         b.tempvar_counter = self.tempvar_counter
         b.label_counter = self.label_counter
         b.generate_code()
         self.tempvar_counter = b.tempvar_counter
         self.label_counter = b.label_counter
+        self.num_temps += b.num_temps
+        self.num_temp_names += b.num_temp_names
 
         #top_scope = self.scope
         #while top_scope.parent_scope:
@@ -91,8 +268,6 @@ class Batch(CodeGenerator):
         # Don't kill the stack.
         self.push('include', STR)
 
-        self.includes.append(s)
-
     def check_builtin(self, name):
         try:
             mod = __import__('codegen.batch.builtins.' + name, fromlist=['emit_code'])
@@ -106,7 +281,11 @@ class Batch(CodeGenerator):
         code = ''
 
         for s in self.segments:
-            code += self.segments[s] + '\n'
+            segment = self.segments[s]
+            if self.peephole:
+                segment = self.peephole.optimize(segment)
+
+            code += segment + '\n'
 
         return code
 
@@ -128,10 +307,60 @@ class Batch(CodeGenerator):
                 type_ = STR
                 break
 
+        prefix = self.prefixes[-1]
+
+        self.num_temps += 1
+
+        free = self.free_temps.get(prefix)
+        if free:
+            name = free.pop()
+        else:
+            self.tempvar_counter += 1
+            self.num_temp_names += 1
+
+            name = '__{}'.format(self.tempvar_counter)
+
+        self.temps.append((prefix, name))
+        return self.decl_var(name, type_, prefix=prefix)
+
+    def statements(self, nodes):
+        # Temporary variables are only used by the statement they are created
+        # for, so their names are reused by the statements after it.  Those
+        # of the enclosing statements are still in use.  The values of
+        # statements are never used, so they are dropped from the stack
+        # without being evaluated.
+        for node in nodes:
+            mark = len(self.temps)
+            height = len(self.value_stack)
+
+            yield node
+
+            del self.value_stack[height:]
+
+            while len(self.temps) > mark:
+                prefix, name = self.temps.pop()
+                self.free_temps.setdefault(prefix, []).append(name)
+
+    def object_var(self):
+        # Objects are named after a variable of their own, which has to be
+        # unique to the call creating it.
         self.tempvar_counter += 1
 
-        name =  '__{}'.format(self.tempvar_counter)
-        return self.decl_var(name, type_)
+        name = '__{}'.format(self.tempvar_counter)
+        return self.decl_var(name, STR)
+
+    def var_prefix(self, symbol):
+        # Only variables captured by closures have to be in the frame of the
+        # call declaring them.  The others are plain variables, unless the
+        # function declaring them can be re-entered.
+        owner = symbol.owner
+        if not owner:
+            return GLOBALS
+
+        if symbol.captured or not owner.binding or owner.binding.symbol.reentrant:
+            return FRAME
+
+        return '__s_{}__.'.format(owner.data)
 
     def enter_scope(self):
         self.scope = self.scope.nested_scope()
@@ -139,16 +368,23 @@ class Batch(CodeGenerator):
     def leave_scope(self):
         self.scope = self.scope.parent_scope
 
-    def push(self, value, type_):
-        self.value_stack.append((value, type_))
+    def push(self, value, type_, deref_type=STR):
+        # deref_type is the type of what references refer to.
+        self.value_stack.append((value, type_, deref_type))
 
     def pop(self):
         # FIXME: Clean this crap up.
         x = self.value_stack.pop()
+
+        if x[1] == EXPR:
+            x = (self.evaluate_expr(x[0]), VAR, x[2])
+        elif x[1] == TEST:
+            x = (self.evaluate_test(x[0]), VAR, x[2])
         y = lambda: None;
 
         y.value = x[0]
         y.type_ = x[1]
+        y.deref_type = x[2]
 
         if y.type_ == VAR:
             y.var = y.value
@@ -165,10 +401,155 @@ class Batch(CodeGenerator):
     def pop_deref(self):
         return self.deref(self.pop())
 
+    def pop_operand(self):
+        # Pops a value to use in an integer expression.  Expressions that
+        # haven't been evaluated are returned in parentheses, with the
+        # expression itself in expr.
+        if self.value_stack[-1][1] != EXPR:
+            return self.pop_deref()
+
+        x = self.value_stack.pop()
+
+        y = lambda: None
+        y.type_ = INT
+        y.expr  = x[0]
+        y.value = '({})'.format(x[0])
+
+        return y
+
+    def int_op(self, op):
+        # Integer operations are combined into expressions that set /a
+        # evaluates as a whole once they are used by anything else, instead of
+        # taking a line and a variable each.
+        b = self.pop_operand()
+        a = self.pop_operand()
+
+        self.push('{}{}{}'.format(a.value, op, b.value), EXPR)
+
+    def emit_int(self, name, expr):
+        # Carets are only escapes if there are variables to expand, so xor
+        # has to be written differently depending on the rest of the line.
+        s = 'set /a "{}={}"'.format(name, expr)
+        if '!' in s:
+            s = s.replace('^', '^^')
+
+        self.emit(s)
+
+    def evaluate_expr(self, expr):
+        temp = self.tempvar(INT)
+        self.emit_int(temp.name, expr)
+
+        return temp
+
+    def evaluate_test(self, test):
+        temp = self.tempvar(INT)
+        s = 'if {} (set /a {}=1) else (set /a {}=0)'
+        self.emit(s.format(test, temp.name, temp.name))
+
+        return temp
+
+    def evaluate(self, a):
+        # Evaluates an operand popped by pop_operand() if it's an expression.
+        if not hasattr(a, 'expr'):
+            return a
+
+        y = lambda: None
+        y.var   = self.evaluate_expr(a.expr)
+        y.type_ = INT
+        y.value = '!{}!'.format(y.var.name)
+
+        return y
+
+    def evaluate_stack(self):
+        # Expressions read their variables when they are evaluated, so those
+        # left on the stack are evaluated before code that could change the
+        # variables, or that only runs sometimes.
+        for i, x in enumerate(self.value_stack):
+            if x[1] == EXPR:
+                self.value_stack[i] = (self.evaluate_expr(x[0]), VAR, x[2])
+            elif x[1] == TEST:
+                self.value_stack[i] = (self.evaluate_test(x[0]), VAR, x[2])
+
+    def compare(self, op, strings=False):
+        # Comparisons are tests for if commands, which are only turned into
+        # zero or one if they are used as values.  Equality compares strings,
+        # which have to be quoted.  Integers are too, since variables inferred
+        # to be integers can still be unset, which would leave if without an
+        # operand.
+        b = self.pop_deref()
+        a = self.pop_deref()
+
+        s = '{} {} {}'
+        if strings:
+            s = '"{}" {} "{}"'
+
+        self.push(s.format(a.value, op, b.value), TEST)
+
+    def pop_test(self):
+        # Pops a value as a test for if commands that holds if it's non-zero.
+        if self.value_stack[-1][1] == TEST:
+            return self.value_stack.pop()[0]
+
+        return '{} neq 0'.format(self.pop().value)
+
+    def jump(self, cond, label, when=True):
+        # Emits code jumping to the label if the condition is true (or false),
+        # testing the operands of && and || one at a time.
+        c = cond.construct
+
+        value = boolean_ternary(cond)
+        if value is not None:
+            for expr in self.jump(cond.children[0], label, when == value):
+                yield expr
+            return
+
+        if c in (syntax.LOGIC_AND, syntax.LOGIC_OR):
+            a = cond.children[0]
+            b = cond.children[1]
+
+            # a && b is false if a is, and a || b true if a is.
+            skip = None
+            if (c == syntax.LOGIC_OR) == when:
+                for expr in self.jump(a, label, when):
+                    yield expr
+            else:
+                skip = self.label()
+                for expr in self.jump(a, skip, not when):
+                    yield expr
+
+            for expr in self.jump(b, label, when):
+                yield expr
+
+            if skip:
+                self.emit(':{}'.format(skip))
+
+            return
+
+        yield cond
+
+        test = self.pop_test()
+        if not when:
+            test = negate(test)
+
+        self.emit('if {} goto {}'.format(test, label))
+
+    def indirect(self, name, ref, s='{}'):
+        # Sets the variable to s with the value of the variable named by ref
+        # in place of {}.  call set is much slower than letting a for loop
+        # expand the name, but kept to compare the two.  for /f reads the name
+        # as a string, where a plain for would take * and ? as wildcards.
+        if self.indirection == 'call':
+            value = s.format('%%{}%%'.format(ref))
+            self.emit('call set "{}={}"'.format(name, value))
+        else:
+            value = s.format('!%%v!')
+            s = 'for /f "eol= delims=" %%v in ("{}") do set "{}={}"'
+            self.emit(s.format(ref, name, value))
+
     def deref(self, a):
         if a.type_ == REF:
-            temp = self.tempvar(STR)
-            self.emit('call set "{}=%%{}%%"'.format(temp.name, a.value))
+            temp = self.tempvar(a.deref_type)
+            self.indirect(temp.name, a.value)
 
             y = lambda: None
             y.var = temp
@@ -183,32 +564,32 @@ class Batch(CodeGenerator):
 
     @code_emitter(syntax.ADD)
     def __add(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
-
-        b = self.pop_deref()
-        a = self.pop_deref()
+        yield node.children[0]
+        yield node.children[1]
 
-        temp = self.tempvar(a.type_, b.type_)
+        b = self.pop_operand()
+        a = self.pop_operand()
 
         # If all involved vars are integers, we do an arithmetic operation.
         if a.type_ == INT and b.type_ == INT:
-            s = 'set /a "{}={}+{}"'
-        else:
-            s = 'set "{}={}{}"'
+            self.push('{}+{}'.format(a.value, b.value), EXPR)
+            return
 
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        a = self.evaluate(a)
+        b = self.evaluate(b)
 
+        temp = self.tempvar(a.type_, b.type_)
+        self.emit('set "{}={}{}"'.format(temp.name, a.value, b.value))
+        self.push(temp, VAR)
 
     @code_emitter(syntax.ARRAY)
     def __array(self, node):
-        temp = self.tempvar(STR)
+        temp = self.object_var()
         self.emit('set "{}={}"'.format(temp.name, temp.name))
 
         index = 0
         for item in node.children:
-            self._gen_code(item)
+            yield item
             self.emit('set "{}.{}={}"'.format(temp.name, index, self.pop().value))
             index += 1
 
@@ -218,8 +599,8 @@ class Batch(CodeGenerator):
 
     @code_emitter(syntax.ARRAY_IDX)
     def __array_idx(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
         b = self.pop().value
         a = self.pop_deref().value
@@ -231,53 +612,38 @@ class Batch(CodeGenerator):
         ident = node.children[0]
         expr = node.children[1]
 
-        self._gen_code(expr)
+        yield expr
 
-        b = self.pop_deref()
+        b = self.pop_operand()
+        self.evaluate_stack()
 
         # TODO: Is this sane?
         if ident.construct == syntax.IDENTIFIER:
-            if not self.scope.is_decl(ident.data):
-                type_ = b.type_
-                if type_ == REF:
-                    type_ = VAR
-                a = self.decl_var(ident.data, type_).name
+            binding = ident.binding
+            if binding.symbol not in self.variables:
+                # This is the assignment declaring the variable.
+                symbol = binding.symbol
+                var = self.decl_var(ident.data, symbol.type_, prefix=self.var_prefix(symbol))
+                self.variables[binding.symbol] = var
+                a = var.name
             else:
+                var = self.variables[binding.symbol]
+                a = var.name
 
-                a = self.scope.var(ident.data).name
-
-                var = self.scope.var(ident.data)
-                if var.scope != self.scope and isinstance(var.name, str) and var.name.startswith('__c_%~2__.'):
-                    scopes_out = 0
-                    scope = self.scope
-                    while scope != var.scope:
-                        scope = scope.parent_scope
-                        scopes_out += 1
-
-                    var_name = var.name[10:]
-
-                    t = self.tempvar(INT)
-
-                    self.emit('set {}=__c_%~2__'.format(t.name))
-
-                    #self.emit('echo oo')
-                    #self.emit('echo !{}!'.format(t.name))
-                    for i in range(scopes_out):
-                        self.emit('set {}=!{}!.__p'.format(t.name, t.name))
-                        #self.emit('echo a !{}!'.format(t.name))
-                        self.emit('call set {}=__c_%%!{}!%%__'.format(t.name, t.name))
-                        #self.emit('echo b !{}!'.format(t.name))
-
-                    a = '!{}!.{}'.format(t.name, var_name)
-
+                if binding.hops > 0 and is_closure_var(var):
+                    a = self.closure_var(var, binding.hops)
+        else:
+            b = self.evaluate(b)
 
+            yield ident
+            a = self.pop().value
 
+        yield ident
 
-        else:
-            self._gen_code(ident)
-            a = self.pop().value
+        if hasattr(b, 'expr'):
+            self.emit_int(a, b.expr)
+            return
 
-        self._gen_code(ident)
         switches = []
 
         if b.type_ == INT:
@@ -289,42 +655,24 @@ class Batch(CodeGenerator):
 
     @code_emitter(syntax.BIN_AND)
     def __bin_and(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref()
-        a = self.pop_deref()
-
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}&{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('&')
 
     @code_emitter(syntax.BIN_OR)
     def __bin_or(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref()
-        a = self.pop_deref()
-
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}|{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('|')
 
     @code_emitter(syntax.BIN_XOR)
     def __bin_xor(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref()
-        a = self.pop_deref()
-
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}^^{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('^')
 
     @code_emitter(syntax.BREAK)
     def __break(self, node):
@@ -336,7 +684,7 @@ class Batch(CodeGenerator):
 
     @code_emitter(syntax.DEC)
     def __dec(self, node):
-        self._gen_code(node.children[0])
+        yield node.children[0]
 
         a = self.pop()
         b = self.deref(a)
@@ -346,6 +694,8 @@ class Batch(CodeGenerator):
         if hasattr(a, 'var'):
             s = a.var.name
 
+        self.evaluate_stack()
+
         temp = self.tempvar(INT)
         self.emit('set /a "{}={}"'.format(temp.name, b.value))
         self.emit('set /a "{}={}-1"'.format(s, b.value))
@@ -353,40 +703,24 @@ class Batch(CodeGenerator):
 
     @code_emitter(syntax.DIVIDE)
     def __divide(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref()
-        a = self.pop_deref()
-
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}/{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('/')
 
     @code_emitter(syntax.EQUAL)
     def __equal(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref().value
-        a = self.pop_deref().value
-
-        temp = self.tempvar(INT)
-        s = 'if "{}" equ "{}" (set /a {}=1) else (set /a {}=0)'
-        self.emit(s.format(a, b, temp.name, temp.name))
-        self.push(temp, VAR)
+        self.compare('equ', strings=True)
 
     @code_emitter(syntax.EQUAL_UNDEF)
     def __equal_undef(self, node):
-        self._gen_code(node.children[0])
+        yield node.children[0]
 
         a = self.pop_deref().value
-
-        temp = self.tempvar(INT)
-        s = 'if "{}" equ "" (set /a {}=1) else (set /a {}=0)'
-        self.emit(s.format(a, temp.name, temp.name))
-        self.push(temp, VAR)
+        self.push('"{}" equ ""'.format(a), TEST)
 
     @code_emitter(syntax.FOR)
     def __for(self, node):
@@ -398,21 +732,23 @@ class Batch(CodeGenerator):
         loop = node.children[2]
 
         if init.construct != syntax.NOOP:
-            self._gen_code(init)
+            for expr in self.statements([init]):
+                yield expr
 
         self.emit(':{}'.format(label))
 
         if cond.construct != syntax.NOOP:
-            self._gen_code(cond)
-            self.emit('if {} equ 0 (goto :{}_)'.format(self.pop().value, label))
+            for expr in self.jump(cond, label + '_', False):
+                yield expr
 
-        for expr in node.children[3:]:
-            self._gen_code(expr)
+        for expr in self.statements(node.children[3:]):
+            yield expr
 
 
         self.emit(':{}_continue'.format(label))
         if loop.construct != syntax.NOOP:
-            self._gen_code(loop)
+            for expr in self.statements([loop]):
+                yield expr
 
         self.emit('goto :{}'.format(label))
         self.emit(')')
@@ -420,7 +756,7 @@ class Batch(CodeGenerator):
 
         self.loop_labels.pop()
 
-    def decl_var(self, name, type_, global_scope=False):
+    def decl_var(self, name, type_, global_scope=False, prefix=FRAME):
         scope = self.scope
 
         if global_scope:
@@ -429,10 +765,27 @@ class Batch(CodeGenerator):
 
         var = scope.decl_var(name, type_)
 
-        var.name = '__c_%~2__.' + var.name
+        var.name = prefix + var.name
+
+        if self.deep_funcs:
+            self.deep_funcs[-1][3].append(var)
 
         return var
 
+    def closure_var(self, var, hops):
+        # Returns a reference to a variable in the closure of a function the
+        # specified number of functions out from the current one.
+        var_name = var.name[10:]
+
+        t = self.tempvar(INT)
+
+        self.emit('set {}={}'.format(t.name, FRAME[:-1]))
+
+        for i in range(hops):
+            self.indirect(t.name, '!{}!.__p'.format(t.name), '__c_{}__')
+
+        return '!{}!.{}'.format(t.name, var_name)
+
     @code_emitter(syntax.FUNC)
     def __func(self, node):
         func_name = node.data
@@ -454,20 +807,30 @@ class Batch(CodeGenerator):
 
             ret.type_ = STR
             ret.name = func_name
+
+            self.variables[node.binding.symbol] = ret
         else:
             func_name = self.label()
 
-            t = self.tempvar(STR)
+            t = self.object_var()
             self.emit('set {}={}'.format(t.name, t.name))
             self.emit('set {}.__f={}'.format(t.name, func_name))
-            self.emit('set {}.__c=!__c_%~2__!'.format(t.name))
+            self.emit('set {}.__c=%~2'.format(t.name))
             ret = t
 
         self.emit('goto {}_'.format(func_name)),
         self.emit(':{}'.format(func_name))
 
-        self.emit('set __c_%~2__=%~2')
-        self.emit('set __c_%~2__.__p=%~3')
+        # Frames are only needed when closures follow the chain of frames from
+        # or through this function.
+        if not is_global or node.binding.symbol.frame:
+            self.emit('set __c_%~2__=%~2')
+            self.emit('set __c_%~2__.__p=%~3')
+
+        if is_global and not node.binding.symbol.reentrant:
+            self.prefixes.append('__s_{}__.'.format(func_name))
+        else:
+            self.prefixes.append(FRAME)
 
         #self.emit('echo current closure is %~2 in ' + func_name)
         #self.emit('echo stored closure is %~3  in ' + func_name)
@@ -480,21 +843,90 @@ class Batch(CodeGenerator):
         # Start from 4 since first 3 args are reserved for impl.
         param_counter = 4
         for param in params.children:
-            # TODO: Don't assume str here. Be water, my friend!
-            var = self.decl_var(param.data, STR)
+            var = self.decl_var(param.data, param.binding.symbol.type_)
             var.name = param_counter
             param_counter += 1
 
-        for expr in body.children:
-            self._gen_code(expr)
+            self.variables[param.binding.symbol] = var
+
+        # Functions recursing on a stack of their own can't be re-entered, so
+        # they only need one base and result variable.
+        deep = is_global and node.binding.symbol.deep and not node.binding.symbol.reentrant
+        if deep:
+            base   = self.tempvar(INT)
+            result = self.tempvar(STR)
+
+            self.emit('set /a __dsp__=0', 'decl')
+            self.emit('set /a "{}=__dsp__"'.format(base.name))
 
-        if not body.children or not body.children[-1].construct == syntax.RETURN:
+            self.deep_funcs.append((node.binding.symbol, self.label(), result, []))
+            self.flat = True
+
+        # Functions making tail calls set their parameters for the next call,
+        # so they are kept in variables instead.
+        tail_calls = is_global and (node.binding.symbol.tail_calls or deep)
+        if tail_calls:
+            param_vars = []
+            for param in params.children:
+                symbol = param.binding.symbol
+
+                var = self.decl_var(param.data, symbol.type_, prefix=self.var_prefix(symbol))
+                self.emit('set "{}=%~{}"'.format(var.name, symbol.slot))
+                self.variables[symbol] = var
+
+                param_vars.append(var)
+
+            label = self.label()
+            self.emit(':{}'.format(label))
+            self.tail_funcs.append((label, param_vars))
+
+        # Variables outside the frame keep their values between calls, so those
+        # that can be read before they are assigned are cleared for each one.
+        # They are all declared up front to have deep calls save all of them.
+        if is_global:
+            reads = unassigned_reads(node)
+
+            for symbol in local_symbols(node):
+                prefix = self.var_prefix(symbol)
+                if prefix == FRAME:
+                    continue
+
+                var = self.decl_var(symbol.name, symbol.type_, prefix=prefix)
+                self.variables[symbol] = var
+
+                if symbol in reads:
+                    self.emit('set "{}="'.format(var.name))
+
+        for expr in self.statements(body.children):
+            yield expr
+
+        if tail_calls:
+            self.tail_funcs.pop()
+
+        if deep:
+            _, ret_label, result, _ = self.deep_funcs.pop()
+            self.flat = False
+
+            if not always_returns(body):
+                self.emit('set "{}=0"'.format(result.name))
+
+            # Returns to the caller once the stack is back where it was when
+            # the function was called, and otherwise to the call that pushed
+            # the frame on top.
+            self.emit(':{}'.format(ret_label))
+            self.emit('if !__dsp__! equ !{}! ('.format(base.name))
+            self.emit('set %1=!{}!'.format(result.name))
+            self.emit('goto :eof')
+            self.emit(')')
+            self.emit('for %%s in (!__dsp__!) do goto !__ds_%%s.r!')
+        elif not always_returns(body):
             self.emit('set %~1=0')
             self.emit('goto :eof')
         #    self.emit('endlocal & (set %1=0)')
         #    self.emit('exit /b')
         self.emit(':{}_'.format(func_name))
 
+        self.prefixes.pop()
         self.leave_scope()
         self.push(ret, VAR)
 
@@ -515,13 +947,29 @@ class Batch(CodeGenerator):
             self.raw(node.children[1].data, target)
             return
 
-        self._gen_code(node.children[0])
+        if node.is_tail_call:
+            for expr in self.tail_call(node):
+                yield expr
+            return
+
+        if self.deep_funcs and direct_callee(node) is self.deep_funcs[-1][0]:
+            for expr in self.deep_call(node):
+                yield expr
+            return
+
+        # Calls to named functions have the type they return.
+        type_ = STR
+        func = node.children[0]
+        if func.construct == syntax.IDENTIFIER and func.binding.symbol.kind == FUNCTION:
+            type_ = func.binding.symbol.returns
+
+        yield func
 
         func_name = self.pop_deref().value
         #self.emit('set this={}'.format(func_name))
 
         for arg in node.children[1:]:
-            self._gen_code(arg)
+            yield arg
 
         num_args = len(node.children)
         for i in range(1, num_args):
@@ -533,7 +981,10 @@ class Batch(CodeGenerator):
 
         args.reverse()
 
-        temp = self.tempvar(STR) # FIXME: Don't assume str!
+        # The called function could change the variables of expressions.
+        self.evaluate_stack()
+
+        temp = self.tempvar(type_)
 
         t = self.tempvar(INT)
         self.emit('set /a "__i__+=1"'.format(t.name))
@@ -542,10 +993,10 @@ class Batch(CodeGenerator):
         nesting = '!{}!'.format(t.name)
 
         t2 = self.tempvar(INT)
-        self.emit('call set {}=%%{}.__c%%'.format(t2.name, func_name))
+        self.indirect(t2.name, '{}.__c'.format(func_name))
 
         t3 = self.tempvar(INT)
-        self.emit('call set {}=%%{}.__f%%'.format(t3.name, func_name))
+        self.indirect(t3.name, '{}.__f'.format(func_name))
 
         #self.emit('echo calling !{}!'.format(t3.name))
 
@@ -553,76 +1004,107 @@ class Batch(CodeGenerator):
         self.emit(s.format(t3.name, temp.name, nesting, t2.name, ' '.join(args)))
         self.push(temp, VAR)
 
-    @code_emitter(syntax.GREATER)
-    def __greater(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+    def set_params(self, node):
+        # Sets the parameters of the function we are in to the arguments of
+        # the call.  Arguments reading parameters set before them are copied
+        # first.
+        _, param_vars = self.tail_funcs[-1]
 
-        b = self.pop_deref().value
-        a = self.pop_deref().value
+        args = [self.pop_deref() for arg in node.children[1:]]
+        args.reverse()
 
-        temp = self.tempvar(INT)
-        s = 'if {} gtr {} (set /a {}=1) else (set /a {}=0)'
-        self.emit(s.format(a, b, temp.name, temp.name))
-        self.push(temp, VAR)
+        values = []
+        for i, var in enumerate(param_vars):
+            if i >= len(args):
+                values.append('')
+                continue
 
-    @code_emitter(syntax.GREATER_EQ)
-    def __greater_eq(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+            value = args[i].value
+            if any('!{}!'.format(v.name) in value for v in param_vars[:i]):
+                temp = self.tempvar(args[i].type_)
+                self.emit('set "{}={}"'.format(temp.name, value))
+                value = '!{}!'.format(temp.name)
 
-        b = self.pop_deref().value
-        a = self.pop_deref().value
+            values.append(value)
 
-        temp = self.tempvar(INT)
-        s = 'if {} geq {} (set /a {}=1) else (set /a {}=0)'
-        self.emit(s.format(a, b, temp.name, temp.name))
-        self.push(temp, VAR)
+        for var, value in zip(param_vars, values):
+            self.emit('set "{}={}"'.format(var.name, value))
 
-    @code_emitter(syntax.IDENTIFIER)
-    def __identifier(self, node):
-        ident = node.data
-        var = self.scope.var(ident)
-
-        #if not var:
-        #    #self.builtins.check(self, ident)
-        #    #self.check_builtin(ident)
-        #    #var = self.scope.var(ident)
-
-        if var.scope != self.scope and isinstance(var.name, str) and var.name.startswith('__c_%~2__.'):
-            scopes_out = 0
-            scope = self.scope
-            while scope != var.scope:
-                scope = scope.parent_scope
-                scopes_out += 1
+    def tail_call(self, node):
+        # Sets the parameters and jumps back to the start of the function.
+        for arg in node.children[1:]:
+            yield arg
 
-            var_name = var.name[10:]
+        self.set_params(node)
+        self.emit('goto {}'.format(self.tail_funcs[-1][0]))
 
-            t = self.tempvar(INT)
+    def deep_call(self, node):
+        # Pushes a frame with the variables of the function and the label to
+        # return to, and jumps back to the start of the function.  Returning
+        # jumps to the label, where the variables are restored.
+        symbol, _, result, saved = self.deep_funcs[-1]
 
-            self.emit('set {}=__c_%~2__'.format(t.name))
+        for arg in node.children[1:]:
+            yield arg
+
+        self.evaluate_stack()
+
+        # Parameters are in variables, and the others are numbered by slot.
+        # Temporary variables can be declared more than once.
+        names = []
+        for var in saved:
+            if isinstance(var.name, str) and var.name not in names:
+                names.append(var.name)
+
+        label = self.label()
+        self.emit('set /a __dsp__+=1')
+        self.emit('set "__ds_!__dsp__!.r={}"'.format(label))
+        for name in names:
+            self.emit('set "__ds_!__dsp__!.{}=!{}!"'.format(name, name))
+
+        self.set_params(node)
+        self.emit('goto {}'.format(self.tail_funcs[-1][0]))
+
+        self.emit(':{}'.format(label))
+        if names:
+            self.emit('for %%s in (!__dsp__!) do (')
+            for name in names:
+                self.emit('set "{}=!__ds_%%s.{}!"'.format(name, name))
+            self.emit(')')
+        self.emit('set /a __dsp__-=1')
+
+        temp = self.tempvar(symbol.returns)
+        self.emit('set "{}=!{}!"'.format(temp.name, result.name))
+        self.push(temp, VAR)
 
-            #self.emit('echo oo')
-            #self.emit('echo !{}!'.format(t.name))
-            for i in range(scopes_out):
-                self.emit('set {}=!{}!.__p'.format(t.name, t.name))
-                #self.emit('echo a !{}!'.format(t.name))
-                self.emit('call set {}=__c_%%!{}!%%__'.format(t.name, t.name))
-                #self.emit('echo b !{}!'.format(t.name))
+    @code_emitter(syntax.GREATER)
+    def __greater(self, node):
+        yield node.children[0]
+        yield node.children[1]
+
+        self.compare('gtr')
 
-            #self.emit('set {}=!{}!.{}'.format(t.name, t.name, var_name))
-            #self.emit('echo c !{}!'.format(t.name))
+    @code_emitter(syntax.GREATER_EQ)
+    def __greater_eq(self, node):
+        yield node.children[0]
+        yield node.children[1]
+
+        self.compare('geq')
+
+    @code_emitter(syntax.IDENTIFIER)
+    def __identifier(self, node):
+        binding = node.binding
+        var = self.variables[binding.symbol]
 
-            #print 'we want', var_name, 'from', scopes_out, 'scopes out'
-            #self.emit('echo !{}!.{}'.format(t.name, var_name))
-            self.push('!{}!.{}'.format(t.name, var_name), REF)
+        if binding.hops > 0 and is_closure_var(var):
+            self.push(self.closure_var(var, binding.hops), REF, var.type_)
             return
 
         self.push(var, VAR)
 
     @code_emitter(syntax.INC)
     def __inc(self, node):
-        self._gen_code(node.children[0])
+        yield node.children[0]
 
         a = self.pop()
         b = self.deref(a)
@@ -632,6 +1114,8 @@ class Batch(CodeGenerator):
         if hasattr(a, 'var'):
             s = a.var.name
 
+        self.evaluate_stack()
+
         temp = self.tempvar(INT)
         self.emit('set /a "{}={}"'.format(temp.name, b.value))
         self.emit('set /a "{}={}+1"'.format(s, b.value))
@@ -643,20 +1127,48 @@ class Batch(CodeGenerator):
         then_expr = node.children[1]
         else_expr = node.children[2]
 
-        self._gen_code(cond)
+        if self.flat:
+            label = self.label()
+            for expr in self.jump(cond, label, False):
+                yield expr
+
+            for expr in self.statements(then_expr.children):
+                yield expr
+
+            if len(else_expr.children) > 0:
+                self.emit('goto {}_'.format(label))
+
+            self.emit(':{}'.format(label))
+
+            if len(else_expr.children) > 0:
+                for expr in self.statements(else_expr.children):
+                    yield expr
+
+                self.emit(':{}_'.format(label))
+
+            return
+
+        # Without an else branch, the operands of && are tested by nested
+        # blocks.
+        conds = [cond]
+        if len(else_expr.children) == 0:
+            conds = and_operands(cond)
 
-        self.emit('if {} neq 0 ('.format(self.pop().value))
+        for expr in conds:
+            yield expr
+            self.emit('if {} ('.format(self.pop_test()))
 
-        for expr in then_expr.children:
-            self._gen_code(expr)
+        for expr in self.statements(then_expr.children):
+            yield expr
 
         if len(else_expr.children) > 0:
             self.emit(') else (')
 
-            for expr in else_expr.children:
-                self._gen_code(expr)
+            for expr in self.statements(else_expr.children):
+                yield expr
 
-        self.emit(')')
+        for expr in conds:
+            self.emit(')')
 
     @code_emitter(syntax.IF_TERNARY)
     def __if_ternary(self, node):
@@ -664,20 +1176,43 @@ class Batch(CodeGenerator):
         then_expr = node.children[1]
         else_expr = node.children[2]
 
-        self._gen_code(cond)
+        yield cond
+
+        test = self.pop_test()
+
+        value = boolean_ternary(node)
+        if value is not None:
+            self.push(test if value else negate(test), TEST)
+            return
+
+        # Only one of the branches runs.
+        self.evaluate_stack()
 
         temp = self.tempvar(STR)
         both_int = False
 
-        self.emit('if {} neq 0 ('.format(self.pop().value))
-        self._gen_code(then_expr)
-        a = self.pop()
-        self.emit('set "{}={}"'.format(temp.name, a.value))
-        self.emit(') else (')
-        self._gen_code(else_expr)
-        b = self.pop()
-        self.emit('set "{}={}"'.format(temp.name, b.value))
-        self.emit(')')
+        if self.flat:
+            label = self.label()
+            self.emit('if {} goto {}'.format(negate(test), label))
+            yield then_expr
+            a = self.pop()
+            self.emit('set "{}={}"'.format(temp.name, a.value))
+            self.emit('goto {}_'.format(label))
+            self.emit(':{}'.format(label))
+            yield else_expr
+            b = self.pop()
+            self.emit('set "{}={}"'.format(temp.name, b.value))
+            self.emit(':{}_'.format(label))
+        else:
+            self.emit('if {} ('.format(test))
+            yield then_expr
+            a = self.pop()
+            self.emit('set "{}={}"'.format(temp.name, a.value))
+            self.emit(') else (')
+            yield else_expr
+            b = self.pop()
+            self.emit('set "{}={}"'.format(temp.name, b.value))
+            self.emit(')')
 
         if a.type_ == INT and b.type_ == INT:
             temp.type_ = INT
@@ -690,108 +1225,99 @@ class Batch(CodeGenerator):
 
     @code_emitter(syntax.LESS)
     def __less(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
-
-        b = self.pop_deref().value
-        a = self.pop_deref().value
+        yield node.children[0]
+        yield node.children[1]
 
-        temp = self.tempvar(INT)
-        s = 'if {} lss {} (set /a {}=1) else (set /a {}=0)'
-        self.emit(s.format(a, b, temp.name, temp.name))
-        self.push(temp, VAR)
+        self.compare('lss')
 
     @code_emitter(syntax.LESS_EQ)
     def __less_eq(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref().value
-        a = self.pop_deref().value
-
-        temp = self.tempvar(INT)
-        s = 'if {} leq {} (set /a {}=1) else (set /a {}=0)'
-        self.emit(s.format(a, b, temp.name, temp.name))
-        self.push(temp, VAR)
+        self.compare('leq')
 
     @code_emitter(syntax.LOGIC_AND)
     def __logic_and(self, node):
         a = node.children[0]
         b = node.children[1]
 
-        self._gen_code(a)
-        self.emit('if {} neq 0 ('.format(self.pop().value))
-        self._gen_code(b)
-        self.emit(')')
+        yield a
+
+        test = self.pop_test()
+        self.evaluate_stack()
+
+        temp = self.tempvar(INT)
+        self.emit('set /a {}=0'.format(temp.name))
+
+        if self.flat:
+            label = self.label()
+            self.emit('if {} goto {}'.format(negate(test), label))
+            yield b
+            self.emit('if {} set /a {}=1'.format(self.pop_test(), temp.name))
+            self.emit(':{}'.format(label))
+        else:
+            self.emit('if {} ('.format(test))
+            yield b
+            self.emit('if {} set /a {}=1'.format(self.pop_test(), temp.name))
+            self.emit(')')
+
+        self.push(temp, VAR)
 
     @code_emitter(syntax.LOGIC_OR)
     def __logic_or(self, node):
         a = node.children[0]
         b = node.children[1]
 
-        temp = self.tempvar(INT)
+        yield a
 
-        self._gen_code(a)
-        self.emit('set /a {}=0'.format(temp.name))
-        self.emit('if {} neq 0 ('.format(self.pop().value))
-        self.emit('set /a {}=1'.format(temp.name))
-        self.emit(') else (')
-        self._gen_code(b)
-        self.emit('if {} neq 0 ('.format(self.pop().value))
+        test = self.pop_test()
+        self.evaluate_stack()
+
+        temp = self.tempvar(INT)
         self.emit('set /a {}=1'.format(temp.name))
-        self.emit(')')
-        self.emit(')')
+
+        if self.flat:
+            label = self.label()
+            self.emit('if {} goto {}'.format(test, label))
+            yield b
+            self.emit('if {} set /a {}=0'.format(negate(self.pop_test()), temp.name))
+            self.emit(':{}'.format(label))
+        else:
+            self.emit('if {} ('.format(negate(test)))
+            yield b
+            self.emit('if {} set /a {}=0'.format(negate(self.pop_test()), temp.name))
+            self.emit(')')
+
         self.push(temp, VAR)
 
     @code_emitter(syntax.MODULO)
     def __modulo(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref()
-        a = self.pop_deref()
-
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}%%{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('%%')
 
     @code_emitter(syntax.MULTIPLY)
     def __multiply(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref()
-        a = self.pop_deref()
-
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}*{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('*')
 
     @code_emitter(syntax.NOT_EQ)
     def __not_eq(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref().value
-        a = self.pop_deref().value
-
-        temp = self.tempvar(INT)
-        s = 'if "{}" neq "{}" (set /a {}=1) else (set /a {}=0)'
-        self.emit(s.format(a, b, temp.name, temp.name))
-        self.push(temp, VAR)
+        self.compare('neq', strings=True)
 
     @code_emitter(syntax.NOT_EQ_UNDEF)
     def __not_eq_undef(self, node):
-        self._gen_code(node.children[0])
+        yield node.children[0]
 
         a = self.pop_deref().value
-
-        temp = self.tempvar(INT)
-        s = 'if "{}" neq "" (set /a {}=1) else (set /a {}=0)'
-        self.emit(s.format(a, temp.name, temp.name))
-        self.push(temp, VAR)
+        self.push('"{}" neq ""'.format(a), TEST)
 
     @code_emitter(syntax.PROGRAM)
     def __program(self, node):
@@ -813,14 +1339,32 @@ class Batch(CodeGenerator):
         self.emit(':__main__'                 , 'postinit')
         self.emit('set __c_%~2__=%~2'         , 'postinit')
 
-        for child in node.children:
-            self._gen_code(child)
+        for child in self.statements(node.children):
+            yield child
 
     @code_emitter(syntax.RETURN)
     def __return(self, node):
-        self._gen_code(node.children[0])
+        yield node.children[0]
 
-        a = self.pop_deref()
+        if node.children[0].is_tail_call:
+            return
+
+        if self.deep_funcs:
+            _, ret_label, result, _ = self.deep_funcs[-1]
+
+            a = self.pop_operand()
+            if hasattr(a, 'expr'):
+                self.emit_int(result.name, a.expr)
+            else:
+                self.emit('set "{}={}"'.format(result.name, a.value))
+            self.emit('goto {}'.format(ret_label))
+            return
+
+        a = self.pop_operand()
+        if hasattr(a, 'expr'):
+            self.emit_int('%~1', a.expr)
+            self.emit('goto :eof')
+            return
 
         #self.emit('endlocal & (')
 
@@ -838,29 +1382,17 @@ class Batch(CodeGenerator):
 
     @code_emitter(syntax.SHIFT_L)
     def __shift_l(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref()
-        a = self.pop_deref()
-
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}<<{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('<<')
 
     @code_emitter(syntax.SHIFT_R)
     def __shift_r(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
-        b = self.pop_deref()
-        a = self.pop_deref()
-
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}>>{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('>>')
 
     @code_emitter(syntax.STRING)
     def __string(self, node):
@@ -881,16 +1413,10 @@ class Batch(CodeGenerator):
 
     @code_emitter(syntax.SUBTRACT)
     def __subtract(self, node):
-        self._gen_code(node.children[0])
-        self._gen_code(node.children[1])
-
-        b = self.pop_deref()
-        a = self.pop_deref()
+        yield node.children[0]
+        yield node.children[1]
 
-        temp = self.tempvar(INT)
-        s = 'set /a "{}={}-{}"'
-        self.emit(s.format(temp.name, a.value, b.value))
-        self.push(temp, VAR)
+        self.int_op('-')
 
     @code_emitter(syntax.WHILE)
     def __while(self, node):
@@ -899,14 +1425,14 @@ class Batch(CodeGenerator):
 
         self.emit(':{}'.format(label))
         self.emit(':{}_continue'.format(label))
-        self._gen_code(node.children[0])
-        self.emit('if {} neq 0 ('.format(self.pop().value))
 
-        for expr in node.children[1:]:
-            self._gen_code(expr)
+        for expr in self.jump(node.children[0], label + '_', False):
+            yield expr
+
+        for expr in self.statements(node.children[1:]):
+            yield expr
 
         self.emit('goto :{}'.format(label))
-        self.emit(')')
         self.emit(':{}_'.format(label))
 
         self.loop_labels.pop()
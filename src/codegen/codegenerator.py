@@ -3,6 +3,7 @@
 #--------------------------------------------------
 
 from parsing.syntax import NOOP
+from parsing.walker import SKIP, dispatch_table, walk
 
 #--------------------------------------------------
 # CLASSES
@@ -11,24 +12,23 @@ from parsing.syntax import NOOP
 class CodeGenerator(object):
     def __init__(self, ast):
         self.ast = ast
-        self.code_funcs = dict()
-
-        for s in dir(self):
-            func = getattr(self, s, None)
-            if not hasattr(func, '_cg_construct'):
-                continue
-
-            self.code_funcs[func._cg_construct] = func
+        self.code_funcs = dispatch_table(type(self), '_cg_construct')
 
     def code(self):
         assert False, "Not implemented"
 
     def _gen_code(self, root):
-        if root.construct == NOOP:
-            return
+        walk(root, self._emit_node)
+
+    def _emit_node(self, node):
+        # Code emitters that need code for other nodes are generators yielding
+        # those nodes, so we never recurse.
+        if node.construct == NOOP:
+            return SKIP
+
+        code_func = self.code_funcs[node.construct]
 
-        code_func = self.code_funcs[root.construct]
-        code_func(root)
+        return code_func(self, node) or SKIP
 
     def generate_code(self):
         self._gen_code(self.ast)
@@ -1,3 +1,10 @@
+#--------------------------------------------------
+# IMPORTS
+#--------------------------------------------------
+
+from parsing.syntax import NAMES
+from parsing.walker import walk
+
 #--------------------------------------------------
 # FUNCTIONS
 #--------------------------------------------------
@@ -5,10 +12,7 @@
 def print_node(node, level):
     """Prints the specified node by displaying its information."""
 
-    words = node.construct.split(' ')
-    label = '_'.join([x[:4] for x in words])
-
-    nodetype = node.construct
+    nodetype = NAMES[node.construct]
     tab = '    ' * (level-1)
     sep = '+-- ' if level > 0 else ''
 
@@ -24,8 +28,14 @@ def visualize_ast(root, level=0):
     :param level: Reserved.
     """
 
-    print_node(root, level)
+    levels = [level]
+
+    def enter(node):
+        print_node(node, levels[-1])
+        levels.append(levels[-1]+1)
+
+    def leave(node):
+        levels.pop()
+        return node
 
-    if root.children:
-        for child in root.children:
-            visualize_ast(child, level+1)
+    walk(root, enter, leave)
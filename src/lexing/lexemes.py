@@ -1,74 +1,86 @@
+#--------------------------------------------------
+# FUNCTIONS
+#--------------------------------------------------
+
+# Token categories are stored as small integers.  NAMES maps them back to
+# readable names for error messages.
+NAMES = []
+
+def category(name):
+    NAMES.append(name)
+    return len(NAMES) - 1
+
 #--------------------------------------------------
 # CONSTANTS
 #--------------------------------------------------
 
 # Special lexemes.
-EOF = '<eof>'
+EOF = category('<eof>')
 
 # Special characters.
-ASTERISK    = 'asterisk'
-ASTERISK_EQ = 'asterisk equals'
-BIN_AND     = 'binary and'
-BIN_AND_EQ  = 'binary and equals'
-BIN_OR      = 'binary or'
-BIN_OR_EQ   = 'binary or equals'
-BIN_XOR     = 'binary xor'
-BIN_XOR_EQ  = 'binary xor equals'
-BREAK       = 'break'
-COLON       = 'colon'
-COMMA       = 'comma'
-COMMENT     = 'comment'
-CONTINUE    = 'continue'
-EQ_SIGN     = 'equals sign'
-EQ_SIGN_2   = 'double equals sign'
-FOR         = 'for'
-GREATER     = 'greater than'
-GREATER_EQ  = 'greater than or equal'
-LESS        = 'less than'
-LESS_EQ     = 'less than or equal'
-LOGIC_AND   = 'logical and'
-LOGIC_OR    = 'logical or'
-L_BRACE     = 'left brace'
-L_BRACK     = 'left bracket'
-L_PAREN     = 'left parenthesis'
-MINUS_EQ    = 'minus equals'
-MINUS_MINUS = 'double minus sign'
-MINUS_SIGN  = 'minus sign'
-MODULO      = 'modulo'
-MODULO_EQ   = 'modulo equals'
-NEWLINE     = 'newline'
-NOT         = 'not'
-NOT_EQ      = 'not equal'
-PERIOD      = 'period'
-PLUS_EQ     = 'plus equals'
-PLUS_PLUS   = 'double plus sign'
-PLUS_SIGN   = 'plus sign'
-Q_MARK      = 'question mark'
-R_BRACE     = 'right brace'
-R_BRACK     = 'right bracket'
-R_PAREN     = 'right parenthesis'
-SEMICOLON   = 'semicolon'
-SHIFT_L     = 'shift left'
-SHIFT_L_EQ  = 'shift left equals'
-SHIFT_R     = 'shift right'
-SHIFT_R_EQ  = 'shift right equals'
-SLASH       = 'slash'
-SLASH_EQ    = 'slash equals'
+ASTERISK    = category('asterisk')
+ASTERISK_EQ = category('asterisk equals')
+BIN_AND     = category('binary and')
+BIN_AND_EQ  = category('binary and equals')
+BIN_OR      = category('binary or')
+BIN_OR_EQ   = category('binary or equals')
+BIN_XOR     = category('binary xor')
+BIN_XOR_EQ  = category('binary xor equals')
+BREAK       = category('break')
+COLON       = category('colon')
+COMMA       = category('comma')
+COMMENT     = category('comment')
+CONTINUE    = category('continue')
+EQ_SIGN     = category('equals sign')
+EQ_SIGN_2   = category('double equals sign')
+FOR         = category('for')
+GREATER     = category('greater than')
+GREATER_EQ  = category('greater than or equal')
+LESS        = category('less than')
+LESS_EQ     = category('less than or equal')
+LOGIC_AND   = category('logical and')
+LOGIC_OR    = category('logical or')
+L_BRACE     = category('left brace')
+L_BRACK     = category('left bracket')
+L_PAREN     = category('left parenthesis')
+MINUS_EQ    = category('minus equals')
+MINUS_MINUS = category('double minus sign')
+MINUS_SIGN  = category('minus sign')
+MODULO      = category('modulo')
+MODULO_EQ   = category('modulo equals')
+NEWLINE     = category('newline')
+NOT         = category('not')
+NOT_EQ      = category('not equal')
+PERIOD      = category('period')
+PLUS_EQ     = category('plus equals')
+PLUS_PLUS   = category('double plus sign')
+PLUS_SIGN   = category('plus sign')
+Q_MARK      = category('question mark')
+R_BRACE     = category('right brace')
+R_BRACK     = category('right bracket')
+R_PAREN     = category('right parenthesis')
+SEMICOLON   = category('semicolon')
+SHIFT_L     = category('shift left')
+SHIFT_L_EQ  = category('shift left equals')
+SHIFT_R     = category('shift right')
+SHIFT_R_EQ  = category('shift right equals')
+SLASH       = category('slash')
+SLASH_EQ    = category('slash equals')
 
 # Keywords.
-ELSE      = 'else'
-FALSE     = 'false'
-FUNC      = 'function'
-IF        = 'if'
-RETURN    = 'return'
-TRUE      = 'true'
-UNDEFINED = 'undefined'
-WHILE     = 'while'
+ELSE      = category('else')
+FALSE     = category('false')
+FUNC      = category('function')
+IF        = category('if')
+RETURN    = category('return')
+TRUE      = category('true')
+UNDEFINED = category('undefined')
+WHILE     = category('while')
 
 # User specified.
-IDENT = 'identifier'
-INT   = 'integer'
-STR   = 'string'
+IDENT = category('identifier')
+INT   = category('integer')
+STR   = category('string')
 
 # Lexeme lookup table.
 LEXEME_MAP = {
@@ -6,18 +6,214 @@ import re
 
 import mshl
 
-from .lexemes import EOF, LEXEME_MAP, NEWLINE
+from .lexemes import COMMENT, EOF, IDENT, LEXEME_MAP, NEWLINE, STR
 from .token   import Token
 
+#--------------------------------------------------
+# CONSTANTS
+#--------------------------------------------------
+
+# Characters that have a special meaning in a regex unless they are escaped.
+REGEX_META = '.^$*+?{}[]()|'
+
+# The furthest any lexeme pattern looks past the end of what it matches (i.e.
+# '0x' followed by a non-hex digit is matched as '0' after looking at three
+# characters).  Edits this close to a token may change it.
+RELEX_LOOKAHEAD = 2
+
+#--------------------------------------------------
+# FUNCTIONS
+#--------------------------------------------------
+
+def create_lexer(source):
+    if mshl.conf and mshl.conf.flag('--legacy-lexer'):
+        return CharLexer(source)
+
+    return Lexer(source)
+
+def literal_lexeme(regex):
+    # Returns the string matched by the regex if the regex only matches one
+    # string (i.e. '\+=' is '+='), otherwise None.
+    s = ''
+
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            i += 1
+            char = regex[i]
+            if char.isalnum():
+                # Character classes like \n, \s etc.
+                return None
+        elif char in REGEX_META:
+            return None
+
+        s += char
+        i += 1
+
+    return s
+
+def build_master_regex():
+    # Builds one pattern out of all lexemes in the lexeme map.  Python regex
+    # alternation picks the first alternative that matches, not the longest
+    # one, so the alternatives are ordered to make the first match the longest:
+    # open-ended patterns first (longest pattern source first, which puts hex
+    # and binary integers before decimal ones), then literal operators from
+    # longest to shortest.  Keywords are left out and resolved by looking up
+    # identifiers instead.
+    ident_regex = None
+    keywords = {}
+    patterns = []
+    operators = []
+
+    for regex, category in LEXEME_MAP.iteritems():
+        lexeme = literal_lexeme(regex)
+
+        if category == IDENT:
+            ident_regex = regex
+        elif lexeme is None:
+            patterns.append((regex, category))
+        elif re.match('[_A-Za-z]+$', lexeme):
+            keywords[lexeme] = category
+        else:
+            operators.append((regex, category, lexeme))
+
+    patterns.sort(key=lambda x: -len(x[0]))
+    operators.sort(key=lambda x: -len(x[2]))
+
+    patterns.append((ident_regex, IDENT))
+    patterns.extend((regex, category) for regex, category, _ in operators)
+
+    groups = []
+    categories = {}
+    for i, (regex, category) in enumerate(patterns):
+        name = 'l{}'.format(i)
+        groups.append('(?P<{}>{})'.format(name, regex))
+        categories[name] = category
+
+    return re.compile('|'.join(groups)), categories, keywords
+
+def token_end(tok):
+    # Returns the position of the lexer right after it has read the token.
+    # Newline tokens are placed at the end of the whitespace they stand for.
+    if tok.lexeme is None or tok.category == NEWLINE:
+        return tok.pos
+
+    return tok.pos + len(tok.lexeme)
+
 #--------------------------------------------------
 # CLASSES
 #--------------------------------------------------
 
 class Lexer(object):
+    master_regex, categories, keywords = build_master_regex()
+    whitespace_regex = re.compile('\\s*')
+
     def __init__(self, source):
-        self.row    = 1
-        self.column = 1
+        # We scan the source buffer directly instead of reading characters.
+        self.text  = source.string
+        self.pos   = source.pos
+        self.lines = source.lines
+
+    def read_token(self):
+        while True:
+            # Skip whitespace.
+            start = self.pos
+            self.pos = self.whitespace_regex.match(self.text, start).end()
+
+            if self.text.find('\n', start, self.pos) >= 0:
+                return Token(NEWLINE, '\n', self.pos, self.lines)
+
+            if self.pos >= len(self.text):
+                # We've reached the end of the source.
+                return Token(EOF, None, self.pos, self.lines)
+
+            match = self.master_regex.match(self.text, self.pos)
+            if match:
+                break
 
+            mshl.error('sequence not understood: {}'.format(self.text[self.pos]))
+            self.pos += 1
+
+        start  = self.pos
+        lexeme = match.group()
+
+        category = self.categories[match.lastgroup]
+        if category == IDENT:
+            category = self.keywords.get(lexeme, IDENT)
+
+        if category not in (COMMENT, STR):
+            # Identifiers and operators repeat a lot; share their lexemes.
+            lexeme = intern(lexeme)
+
+        self.pos = match.end()
+
+        return Token(category, lexeme, start, self.lines)
+
+    def read_tokens(self):
+        tokens = []
+
+        while True:
+            tok = self.read_token()
+            tokens.append(tok)
+
+            if tok.category == EOF:
+                return tokens
+
+    def relex(self, tokens, start, end, length):
+        # Relexes the source after an edit that replaced the characters between
+        # start and end of the old source with length new characters.  tokens
+        # are the tokens of the old source.  Lexing restarts at the last token
+        # that the edit cannot have affected and stops as soon as the lexer is
+        # back at a position where it stopped in the old source, after the
+        # edit.  The lexer has no state besides its position, so the rest of
+        # the old tokens are copied, moved by the size of the edit.  The old
+        # tokens are left as they are, and the ones before the edit are shared
+        # by both lists.
+        delta = length - (end - start)
+
+        # Find the number of tokens that are still valid.
+        lo = 0
+        hi = len(tokens)
+        while lo < hi:
+            mid = (lo+hi) // 2
+            if token_end(tokens[mid]) + RELEX_LOOKAHEAD <= start:
+                lo = mid+1
+            else:
+                hi = mid
+
+        new_tokens = tokens[:lo]
+        self.pos = token_end(tokens[lo-1]) if lo > 0 else 0
+
+        i = lo
+        while True:
+            tok = self.read_token()
+            new_tokens.append(tok)
+
+            if tok.category == EOF:
+                return new_tokens
+
+            # Position in the old source.
+            pos = self.pos - delta
+            if pos < end:
+                continue
+
+            while i < len(tokens) and token_end(tokens[i]) < pos:
+                i += 1
+
+            if token_end(tokens[i]) == pos and tokens[i].category != EOF:
+                break
+
+        for tok in tokens[i+1:]:
+            new_tokens.append(Token(tok.category, tok.lexeme, tok.pos + delta, self.lines))
+
+        return new_tokens
+
+class CharLexer(object):
+    # The original lexer, growing lexemes one character at a time.  Kept for
+    # comparison with Lexer (see --legacy-lexer).
+
+    def __init__(self, source):
         self.source = source
 
     def create_token(self, lexeme):
@@ -42,11 +238,6 @@ class Lexer(object):
         # No match found.
         return None
 
-    def peek_token(self):
-        print "not implemented yet"
-        assert False
-        pass
-
     def read_token(self):
         # Skip whitespace.
         char = self.peek_char()
@@ -58,11 +249,11 @@ class Lexer(object):
             char = self.peek_char()
 
         lexeme = ''
-        row    = self.row
-        column = self.column
+        pos    = self.source.pos
+        lines  = self.source.lines
 
         if newline:
-            return Token(NEWLINE, '\n', row=row, column=column)
+            return Token(NEWLINE, '\n', pos, lines)
 
         num_attempts = 0
         token = None
@@ -95,30 +286,23 @@ class Lexer(object):
             token = Token(EOF)
 
         if token:
-            token.row = row
-            token.column = column
+            token.pos = pos
+            token.lines = lines
             #print token
             return token
 
         mshl.error('sequence not understood: {}'.format(lexeme))
 
     def peek_char(self):
-        return self.source.peek_char()
-
-    def read_char(self):
-        char = self.source.read_char()
-
-        # Skip carriage returns entirely.
+        # Skip carriage returns entirely.  Sources are read in binary mode, so
+        # CRLF line endings get here as they are.
+        char = self.source.peek_char()
         while char == '\r':
-            char = self.source.read_char()
-
-        if char == '\n':
-            self.column = 1
-            self.row += 1
-        elif char == '\t':
-            # Assume tab width is eight characters.
-            self.column += 8
-        else:
-            self.column += 1
+            self.source.read_char()
+            char = self.source.peek_char()
 
         return char
+
+    def read_char(self):
+        self.peek_char()
+        return self.source.read_char()
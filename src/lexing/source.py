@@ -1,24 +1,97 @@
+#--------------------------------------------------
+# IMPORTS
+#--------------------------------------------------
+
+import bisect
+import mmap
+import re
+
 #--------------------------------------------------
 # CLASSES
 #--------------------------------------------------
 
+class LineTable(object):
+    # Maps offsets in a source to rows and columns.  Tokens only store their
+    # offset, so the table is not built until a position is actually needed
+    # (i.e. when an error or warning is reported).
+
+    def __init__(self, read_text):
+        self.read_text = read_text
+
+        self.starts = None
+        self.text   = None
+
+    def position(self, pos):
+        if self.starts is None:
+            self.text = self.read_text()
+            self.starts = [0]
+            self.starts.extend(m.end() for m in re.finditer('\n', self.text))
+
+        i = bisect.bisect_right(self.starts, pos) - 1
+        s = self.text[self.starts[i]:pos]
+
+        # Carriage returns are skipped entirely and tabs are assumed to be
+        # eight characters wide.
+        column = 1 + len(s) + 7*s.count('\t') - s.count('\r')
+
+        return i+1, column
+
 class StringSource(object):
     def __init__(self, s):
-        self.string = s
+        # The buffer is never modified; we only move a cursor over it.
+        self.string = s or ''
+        self.pos    = 0
+
+        self.lines = LineTable(lambda: self.string)
 
     def peek_char(self):
-        if not self.string or len(self.string) == 0:
+        if self.pos >= len(self.string):
             return None
 
-        return self.string[0]
+        return self.string[self.pos]
 
     def read_char(self):
-        if not self.string or len(self.string) == 0:
+        if self.pos >= len(self.string):
             return None
 
-        char = self.string[0]
+        char = self.string[self.pos]
 
         # "Eat" the first character.
-        self.string = self.string[1:]
+        self.pos += 1
 
         return char
+
+class FileSource(StringSource):
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.f = open(file_name, 'rb')
+
+        try:
+            # The lexer scans the memory map directly, so the file contents are
+            # only copied into Python strings as token lexemes.
+            s = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be memory mapped.
+            s = None
+
+        super(FileSource, self).__init__(s)
+
+        # Rows and columns may be needed long after the map has been closed, so
+        # the line table reads the file again instead.
+        self.lines = LineTable(self.read_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self.string, mmap.mmap):
+            self.string.close()
+
+        self.f.close()
+
+    def read_file(self):
+        with open(self.file_name, 'rb') as f:
+            return f.read()
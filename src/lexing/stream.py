@@ -0,0 +1,75 @@
+#--------------------------------------------------
+# IMPORTS
+#--------------------------------------------------
+
+import collections
+
+from .lexemes import COMMENT, NEWLINE
+
+#--------------------------------------------------
+# CLASSES
+#--------------------------------------------------
+
+class TokenStream(object):
+    # Buffers tokens from a lexer so that the parser can look any number of
+    # tokens ahead.  Comments are dropped here, once, and runs of newlines are
+    # collapsed into a single newline token since the grammar never needs more
+    # than one.
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+
+        self.tokens = collections.deque()
+        self.index  = 0
+        self.marks  = []
+
+        self.last_category = None
+
+    def fill(self, n):
+        while len(self.tokens) - self.index < n:
+            tok = self.lexer.read_token()
+
+            if tok.category == COMMENT:
+                continue
+
+            if tok.category == NEWLINE and self.last_category == NEWLINE:
+                continue
+
+            self.last_category = tok.category
+            self.tokens.append(tok)
+
+    def mark(self):
+        # Remembers the current position so we can go back to it with reset().
+        self.marks.append(self.index)
+
+    def release(self):
+        # Forgets the last mark without going back to it.
+        self.marks.pop()
+        self.trim()
+
+    def reset(self):
+        self.index = self.marks.pop()
+        self.trim()
+
+    def peek(self, k=1):
+        self.fill(k)
+
+        return self.tokens[self.index+k-1]
+
+    def read(self):
+        self.fill(1)
+
+        tok = self.tokens[self.index]
+        self.index += 1
+        self.trim()
+
+        return tok
+
+    def trim(self):
+        # Tokens before the oldest mark can never be read again.
+        if self.marks:
+            return
+
+        while self.index > 0:
+            self.tokens.popleft()
+            self.index -= 1
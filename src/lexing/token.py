@@ -1,14 +1,47 @@
+#--------------------------------------------------
+# IMPORTS
+#--------------------------------------------------
+
+from .lexemes import NAMES
+
 #--------------------------------------------------
 # CLASSES
 #--------------------------------------------------
 
 class Token(object):
-    def __init__(self, category, lexeme=None, row=None, column=None):
+    # Tokens are by far the most numerous objects during lexing, so they are
+    # kept small: an integer category, the lexeme and an offset into the
+    # source.  Rows and columns are looked up on demand.
+    __slots__ = ('category', 'lexeme', 'pos', 'lines')
+
+    def __init__(self, category, lexeme=None, pos=None, lines=None):
         self.category = category
         self.lexeme   = lexeme
 
-        self.row    = row
-        self.column = column
+        self.pos   = pos
+        self.lines = lines
+
+    def __getstate__(self):
+        # Line tables belong to open sources and are not pickled.
+        return (self.category, self.lexeme, self.pos)
+
+    def __setstate__(self, state):
+        self.category, self.lexeme, self.pos = state
+        self.lines = None
+
+    @property
+    def column(self):
+        if not self.lines:
+            return None
+
+        return self.lines.position(self.pos)[1]
+
+    @property
+    def row(self):
+        if not self.lines:
+            return None
+
+        return self.lines.position(self.pos)[0]
 
     def __str__(self):
         # FIXME: Shouldn't display lexeme if it is none
@@ -16,7 +49,7 @@ class Token(object):
 
         return s.format(
             type(self).__name__,
-            self.category,
+            NAMES[self.category],
             self.lexeme,
             self.row,
             self.column)
@@ -11,6 +11,7 @@ import sys
 
 conf = None
 num_errors = 0
+num_warnings = 0
 srcfile = None
 
 #-------------------------------------------------
@@ -38,6 +39,8 @@ class Config(object):
         ]
 
         self.options = {
+            '--indirection': 'for',
+            '--inline-threshold': '12',
             '--max-errors': '10',
             # FIXME: Pick default target depending on platform.
             '--target': 'bat'
@@ -106,6 +109,9 @@ def fatal(s, t=None):
     sys.exit()
 
 def warning(s, t=None):
+    global num_warnings
+    num_warnings += 1
+
     if conf.flag('--warn-err'):
         error(s, t)
         return
@@ -9,52 +9,132 @@ import mshl
 
 from codegen.batchgen      import Batch
 from debug.ast             import visualize_ast
-from lexing.lexer          import Lexer
-from lexing.source         import StringSource
 from optimize.astoptimizer import ASTOptimizer
-from parsing.parser        import Parser
+from optimize.inliner      import Inliner
+from optimize.peephole     import PeepholeOptimizer
+from optimize.recursion    import DeepRecursion
+from optimize.shaker       import TreeShaker
+from optimize.tailcalls    import TailCallElimination
+from parsing.modules       import ModuleGraph
 from semantics.analyzer    import SemanticAnalyzer
+from semantics.binder      import Binder
+from semantics.captures    import CaptureAnalysis
+from semantics.inference   import TypeInference
 
 #-------------------------------------------------
 # FUNCTIONS
 #-------------------------------------------------
 
-def parse_file(s):
-    with open(s, 'r') as f:
-        source = StringSource(f.read())
-
-    lexer  = Lexer(source)
-    parser = Parser(lexer)
-
-    tree = parser.generate_ast()
+def parse_file(s, modules):
+    # Parses the file and everything it includes up front.
+    tree = modules.load(s).tree
 
     if mshl.num_errors > 0:
         mshl.fatal('there were errors')
 
-    analyzer = SemanticAnalyzer()
+    analyzer = SemanticAnalyzer(modules)
     analyzer.verify(tree)
 
+    if mshl.conf.flag('--time-passes'):
+        for passes, t in sorted(analyzer.timings.iteritems()):
+            passes = '+'.join(str(p) for p in passes)
+            mshl.trace('analysis pass {}: {:.3f}s'.format(passes, t))
+
     if not mshl.conf.flag('--no-optim'):
         optim = ASTOptimizer()
-        optim.optimize_ast(tree)
+        for module in modules:
+            optim.optimize_ast(module.tree)
 
     if mshl.num_errors > 0:
         mshl.fatal('there were errors')
 
     return tree
 
-def compile_(tree, destfile):
+def bind(tree, modules):
+    # Identifiers are bound in the tree they will be compiled from.  Returns
+    # the trees of the program and all files it includes.
+    binder = Binder(modules)
+    binder.bind(tree)
+
+    if mshl.num_errors > 0:
+        mshl.fatal('there were errors')
+
+    return [tree] + [modules.load(s).tree for s in binder.includes]
+
+def analyze(trees):
+    CaptureAnalysis().analyze(trees)
+    TypeInference().infer(trees)
+
+def generate(tree, modules):
     target = mshl.conf.option('--target')
     if target == 'bat':
-        codegen = Batch(tree)
+        codegen = Batch(tree, modules)
     else:
         # FIXME: Generate error here.
         mshl.fatal('unsupported target'.format(target))
 
+    if not mshl.conf.flag('--no-optim'):
+        codegen.peephole = PeepholeOptimizer()
+
+    indirection = mshl.conf.option('--indirection')
+    if indirection not in ('call', 'for'):
+        mshl.fatal('unsupported indirection: {}'.format(indirection))
+
+    codegen.indirection = indirection
+
     #mshl.trace('generating code...')
 
     codegen.generate_code()
-    code = codegen.code()
+
+    if mshl.conf.flag('--report-temps'):
+        s = 'temporary variables: {} before reuse, {} after'
+        mshl.trace(s.format(codegen.num_temps, codegen.num_temp_names))
+
+    return codegen.code()
+
+def report_shaken(shaker, num_lines, code):
+    for kind, name in shaker.removed:
+        mshl.trace('removed {}: {}'.format(kind, name))
+
+    num_funcs   = sum(1 for kind, _ in shaker.removed if kind == 'function')
+    num_methods = len(shaker.removed) - num_funcs
+
+    s = 'tree shaking removed {} functions and {} methods, {} of {} lines'
+    mshl.trace(s.format(num_funcs, num_methods, num_lines - code.count('\n'), num_lines))
+
+def compile_(tree, modules, destfile):
+    trees = bind(tree, modules)
+
+    shaker = None
+    if not mshl.conf.flag('--no-optim'):
+        optim = ASTOptimizer()
+
+        threshold = int(mshl.conf.option('--inline-threshold'))
+        Inliner(threshold, optim).inline(trees)
+
+        optim.propagate_constants(trees)
+        optim.eliminate_dead_code(trees)
+
+        shaker = TreeShaker()
+
+        if mshl.conf.flag('--report-shaken'):
+            # Compiled without shaking first, to count the lines saved.
+            analyze(trees)
+            num_lines = generate(tree, modules).count('\n')
+            trees = bind(tree, modules)
+
+        shaker.shake(trees)
+
+        TailCallElimination().eliminate(trees)
+
+    if mshl.conf.flag('--deep-recursion'):
+        DeepRecursion().mark(trees)
+
+    analyze(trees)
+    code = generate(tree, modules)
+
+    if shaker and mshl.conf.flag('--report-shaken'):
+        report_shaken(shaker, num_lines, code)
 
     if mshl.conf.option('--show-code'):
         mshl.trace(code)
@@ -76,14 +156,22 @@ Usage: mshlc [options] <srcfile> [destfile]
 
 Options:
   --analyze         - only perform semantic analysis
+  --cache-dir=<s>   - cache syntax trees of unchanged files in a directory
+  --deep-recursion  - keep recursive calls on a stack of variables
   --inc-dir=<s>     - adds a path as an include directory
+  --indirection=<s> - look up variables by name with 'for' or 'call' set
+  --inline-threshold=<n> - inline functions of up to n nodes (0 disables)
+  --legacy-lexer    - use the old character-by-character lexer
   --max-errors=<n>  - set the max number of errors before exiting
   --no-logo         - don't display logo
   --no-optim        - don't optimize
   --no-warn         - suppress warnings
+  --report-shaken   - show the code removed by tree shaking
+  --report-temps    - show the number of temporary variables before/after reuse
   --show-ast        - show abstract syntax tree
   --show-code       - show code (do not write to file)
   --target=<s>      - compile to the specified target ('bat')
+  --time-passes     - show the time spent in each analysis pass
   --warn-err        - treat warnings as errors
 '''
 )
@@ -117,13 +205,14 @@ def main():
     #os.chdir(os.path.dirname(os.path.abspath(mshl.conf.mshl.srcfile)))
 
     #mshl.trace('generating syntax tree...')
-    tree = parse_file(mshl.srcfile)
+    modules = ModuleGraph()
+    tree = parse_file(mshl.srcfile, modules)
 
     if mshl.conf.flag('--show-ast'):
         show_ast(tree)
     elif not mshl.conf.flag('--analyze'):
         # Semantic analysis is really only relevant for code generation.
-        compile_(tree, destfile)
+        compile_(tree, modules, destfile)
 
 #-------------------------------------------------
 # SCRIPT
@@ -2,7 +2,136 @@
 # IMPORTS
 #-------------------------------------------------
 
+import string
+
 from parsing.syntax import *
+from parsing.walker import dispatch_table, walk
+
+from semantics.binder import VARIABLE
+
+from .shaker import first_statement
+
+#-------------------------------------------------
+# CONSTANTS
+#-------------------------------------------------
+
+# set /a works with signed 32-bit integers.  The smallest one can't be written
+# as a literal, since its absolute value is too large.
+INT_MIN = -2**31
+INT_MAX = 2**31 - 1
+
+# The characters of strings that can be put in code instead of variables.
+SAFE_CHARS = frozenset(string.ascii_letters + string.digits + '_.')
+
+#-------------------------------------------------
+# FUNCTIONS
+#-------------------------------------------------
+
+def int32(value):
+    # Wraps the value around like set /a does when it overflows.
+    value &= 0xffffffff
+    if value > INT_MAX:
+        value -= 2**32
+
+    return value
+
+def int_operands(node):
+    # The values of the children of the node if they are all integers that
+    # set /a can handle, otherwise None.
+    values = []
+    for child in node.children:
+        if child.construct != INTEGER or not INT_MIN < child.data <= INT_MAX:
+            return None
+
+        values.append(child.data)
+
+    return values
+
+def raw_owners(trees):
+    # The functions containing raw code, and None if the top level of a file
+    # does.  Raw code can read their variables by their generated names.
+    owners = set()
+
+    stack = [(tree, None) for tree in trees]
+    while stack:
+        node, owner = stack.pop()
+        c = node.construct
+
+        if c == FUNC_CALL:
+            ident = node.children[0]
+            if ident.construct == IDENTIFIER and ident.data == 'raw':
+                owners.add(owner)
+        elif c == FUNC:
+            owner = node
+
+        if node.children:
+            stack.extend((child, owner) for child in node.children)
+
+    return owners
+
+def divide(a, b):
+    # Division and modulo in set /a round towards zero.
+    if b == 0:
+        return None
+
+    value = abs(a) // abs(b)
+    return -value if (a < 0) != (b < 0) else value
+
+def modulo(a, b):
+    if b == 0:
+        return None
+
+    value = abs(a) % abs(b)
+    return -value if a < 0 else value
+
+def shift_left(a, b):
+    return a << b if 0 <= b < 32 else None
+
+def shift_right(a, b):
+    return a >> b if 0 <= b < 32 else None
+
+def declares(root):
+    # Whether removing the tree would remove declarations: named functions or
+    # assignments, except those inside anonymous functions.
+    stack = [root]
+    while stack:
+        node = stack.pop()
+
+        if node.construct == ASSIGN or (node.construct == FUNC and node.data):
+            return True
+
+        if node.children and node.construct != FUNC:
+            stack.extend(node.children)
+
+    return False
+
+def exits(node):
+    # Whether the statements after the specified one in the same list can
+    # never run.
+    c = node.construct
+
+    if c in (BREAK, CONTINUE, RETURN):
+        return True
+
+    if c == IF:
+        then_expr = node.children[1]
+        else_expr = node.children[2]
+
+        return (then_expr.children and exits(then_expr.children[-1]) and
+                else_expr.children and exits(else_expr.children[-1]))
+
+    return False
+
+def is_constant(node):
+    # Whether the node is a literal that can be put in code in place of a
+    # variable holding it.
+    if node.construct == INTEGER:
+        return INT_MIN < node.data <= INT_MAX
+
+    if node.construct == STRING:
+        return node.data and all(c in SAFE_CHARS for c in node.data)
+
+    return False
 
 #-------------------------------------------------
 # CLASSES
@@ -20,29 +149,203 @@ class ASTOptimizer(object):
         self.optimize_constants = True
         self.optimize_literals  = True
 
-        self.optimizer_funcs = dict()
+        self.optimizer_funcs = dispatch_table(type(self), '_no_construct')
+
+    def optimize_ast(self, root):
+        return walk(root, leave=self.optimize_node)
+
+    def optimize_node(self, node):
+        # Children have already been optimized when we get here.
+        func = self.optimizer_funcs.get(node.construct)
+        if func:
+            return func(self, node)
 
-        for s in dir(self):
-            func = getattr(self, s, None)
-            if not hasattr(func, '_no_construct'):
+        return node
+
+    def propagate_constants(self, trees):
+        # Puts the values of variables that are only assigned once, by a
+        # statement that runs before they can be read, in place of the
+        # variables, folding what can be folded.  This has to be done after
+        # binding, since variables are known by their symbols.  Variables
+        # raw code can read are left alone.
+        #
+        # Folding can make more variables constant, so it's repeated until none
+        # are found.
+        if not self.optimize_constants:
+            return
+
+        while True:
+            self.writes      = {}
+            self.assignments = {}
+            self.statements  = set()
+
+            for tree in trees:
+                walk(tree, self.count_writes)
+
+            owners = raw_owners(trees)
+
+            self.constants = {}
+            for symbol, node in self.assignments.items():
+                if self.writes[symbol] != 1 or node not in self.statements:
+                    continue
+
+                if symbol.kind != VARIABLE or symbol.owner in owners:
+                    continue
+
+                # Leading underscores mark variables used by raw code anywhere
+                # (see SemanticAnalyzer.verify_scope()).
+                if symbol.name.startswith('_'):
+                    continue
+
+                if is_constant(node.children[1]):
+                    self.constants[symbol] = node
+
+            if not self.constants:
+                break
+
+            self.constant_assigns = set(self.constants.values())
+
+            for tree in trees:
+                walk(tree, leave=self.replace_constant)
+
+    def count_writes(self, node):
+        c = node.construct
+
+        # Only statements directly in the program or a function body always run.
+        if c in (FUNC_DEF, PROGRAM):
+            self.statements.update(node.children)
+        elif c in (ASSIGN, DEC, INC):
+            ident = node.children[0]
+            if ident.construct == IDENTIFIER and ident.binding:
+                symbol = ident.binding.symbol
+                self.writes[symbol] = self.writes.get(symbol, 0) + 1
+
+                if c == ASSIGN:
+                    self.assignments[symbol] = node
+
+    def replace_constant(self, node):
+        if node.construct == IDENTIFIER and node.binding:
+            assign = self.constants.get(node.binding.symbol)
+            if assign:
+                value = assign.children[1]
+                return Node(value.construct, value.data, node.token)
+        elif node in self.constant_assigns:
+            return None
+
+        return self.optimize_node(node)
+
+    def eliminate_dead_code(self, trees):
+        # Removes branches of if statements and loops whose conditions are
+        # known after folding, and statements after those that return, break
+        # or continue.  Code declaring something that is used by code that is
+        # kept stays, and so does code including files or containing raw code,
+        # since where it ends up matters.
+        self.references = {}
+        for tree in trees:
+            walk(tree, self.count_references)
+
+        for tree in trees:
+            walk(tree, leave=self.remove_dead_code)
+
+    def count_references(self, node):
+        if node.construct == IDENTIFIER and node.binding:
+            symbol = node.binding.symbol
+            self.references[symbol] = self.references.get(symbol, 0) + 1
+
+    def is_removable(self, nodes):
+        references = {}
+        declared   = []
+
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            c = node.construct
+
+            if c == FUNC_CALL:
+                func = node.children[0]
+                if func.construct == IDENTIFIER and func.data in ('include', 'raw'):
+                    return False
+            elif c == IDENTIFIER and node.binding:
+                symbol = node.binding.symbol
+                references[symbol] = references.get(symbol, 0) + 1
+
+            if c in (ASSIGN, FUNC):
+                ident = node.children[0] if c == ASSIGN else node
+                if ident.binding and ident.binding.symbol.decl is node:
+                    declared.append(ident.binding.symbol)
+
+            if node.children:
+                stack.extend(node.children)
+
+        for symbol in declared:
+            if self.references.get(symbol, 0) > references.get(symbol, 0):
+                return False
+
+        return True
+
+    def remove_dead_code(self, node):
+        i = first_statement(node)
+        if i is None:
+            return node
+
+        children = node.children[:i]
+        for child in node.children[i:]:
+            if len(children) > i and exits(children[-1]) and self.is_removable([child]):
                 continue
 
-            self.optimizer_funcs[func._no_construct] = func
+            children.extend(self.live_code(child))
 
-    def optimize_ast(self, root):
-        if root.children:
-            children = root.children
-            root.children = []
-            for child in children:
-                node = self.optimize_ast(child)
-                if node:
-                    root.children.append(node)
+        node.children = children
 
-        if root.construct in self.optimizer_funcs:
-            func = self.optimizer_funcs[root.construct]
-            return func(root)
+        return node
 
-        return root
+    def live_code(self, node):
+        # The statements to replace a statement with (the branch of an if
+        # statement that is taken, or nothing for loops that never run).
+        c = node.construct
+
+        if c == IF:
+            cond = node.children[0]
+            if cond.construct != INTEGER:
+                return [node]
+
+            if cond.data != 0:
+                live, dead = node.children[1], node.children[2]
+            else:
+                live, dead = node.children[2], node.children[1]
+
+            if self.is_removable([dead]):
+                return live.children
+        elif c == WHILE:
+            cond = node.children[0]
+            if cond.construct == INTEGER and cond.data == 0 and self.is_removable([node]):
+                return []
+        elif c == FOR:
+            init = node.children[0]
+            cond = node.children[1]
+            if cond.construct == INTEGER and cond.data == 0 and self.is_removable(node.children[1:]):
+                return [] if init.construct == NOOP else [init]
+
+        return [node]
+
+    def fold_int(self, node, func):
+        # Folds an operation on integer literals into a literal.
+        if not self.optimize_literals:
+            return node
+
+        values = int_operands(node)
+        if values is None:
+            return node
+
+        value = func(*values)
+        if value is None:
+            return node
+
+        value = int32(value)
+        if value == INT_MIN:
+            return node
+
+        return Node(INTEGER, value, node.token)
 
     @node_optimizer(ADD)
     def __add(self, node):
@@ -53,8 +356,7 @@ class ASTOptimizer(object):
         b = node.children[1]
 
         if a.construct == INTEGER and b.construct == INTEGER:
-            value = int(a.data) + int(b.data)
-            return Node(INTEGER, value, node.token)
+            return self.fold_int(node, lambda a, b: a + b)
 
         if a.construct in (INTEGER, STRING) and b.construct in (INTEGER, STRING):
             value = str(a.data) + str(b.data)
@@ -64,56 +366,145 @@ class ASTOptimizer(object):
 
     @node_optimizer(ASSIGN)
     def __assign(self, node):
-        if hasattr(node, 'is_unused') and node.is_unused:
+        if node.is_unused:
             return None
 
         return node
 
+    @node_optimizer(BIN_AND)
+    def __bin_and(self, node):
+        return self.fold_int(node, lambda a, b: a & b)
+
+    @node_optimizer(BIN_OR)
+    def __bin_or(self, node):
+        return self.fold_int(node, lambda a, b: a | b)
+
+    @node_optimizer(BIN_XOR)
+    def __bin_xor(self, node):
+        return self.fold_int(node, lambda a, b: a ^ b)
+
     @node_optimizer(DIVIDE)
     def __divide(self, node):
+        return self.fold_int(node, divide)
+
+    @node_optimizer(EQUAL)
+    def __equal(self, node):
+        return self.fold_equality(node, True)
+
+    def fold_equality(self, node, equal):
         if not self.optimize_literals:
             return node
 
         a = node.children[0]
         b = node.children[1]
 
+        if a.construct not in (INTEGER, STRING) or b.construct not in (INTEGER, STRING):
+            return node
+
+        # Anything but two integers is compared as strings.
         if a.construct == INTEGER and b.construct == INTEGER:
-            value = int(a.data) / int(b.data)
-            return Node(INTEGER, value, node.token)
+            value = (a.data == b.data)
+        else:
+            value = (str(a.data) == str(b.data))
 
-        return node
+        return Node(INTEGER, int(value == equal), node.token)
 
     @node_optimizer(FUNC)
     def __func(self, node):
-        if hasattr(node, 'is_unused') and node.is_unused:
+        if node.is_unused:
             return None
 
         return node
 
-    @node_optimizer(MULTIPLY)
-    def __multiply(self, node):
+    @node_optimizer(GREATER)
+    def __greater(self, node):
+        return self.fold_int(node, lambda a, b: int(a > b))
+
+    @node_optimizer(GREATER_EQ)
+    def __greater_eq(self, node):
+        return self.fold_int(node, lambda a, b: int(a >= b))
+
+    @node_optimizer(IF_TERNARY)
+    def __if_ternary(self, node):
         if not self.optimize_literals:
             return node
 
-        a = node.children[0]
-        b = node.children[1]
+        cond      = node.children[0]
+        then_expr = node.children[1]
+        else_expr = node.children[2]
 
-        if a.construct == INTEGER and b.construct == INTEGER:
-            value = int(a.data) * int(b.data)
-            return Node(INTEGER, value, node.token)
+        if cond.construct != INTEGER:
+            return node
 
-        return node
+        if cond.data != 0:
+            value, removed = then_expr, else_expr
+        else:
+            value, removed = else_expr, then_expr
 
-    @node_optimizer(SUBTRACT)
-    def __subtract(self, node):
+        if declares(removed):
+            return node
+
+        return value
+
+    @node_optimizer(LESS)
+    def __less(self, node):
+        return self.fold_int(node, lambda a, b: int(a < b))
+
+    @node_optimizer(LESS_EQ)
+    def __less_eq(self, node):
+        return self.fold_int(node, lambda a, b: int(a <= b))
+
+    @node_optimizer(LOGIC_AND)
+    def __logic_and(self, node):
+        return self.fold_logic(node, False)
+
+    @node_optimizer(LOGIC_OR)
+    def __logic_or(self, node):
+        return self.fold_logic(node, True)
+
+    def fold_logic(self, node, value):
+        # The right operand is only evaluated if the left one isn't enough to
+        # tell the value (zero for &&, anything else for ||).
         if not self.optimize_literals:
             return node
 
         a = node.children[0]
         b = node.children[1]
 
-        if a.construct == INTEGER and b.construct == INTEGER:
-            value = int(a.data) - int(b.data)
-            return Node(INTEGER, value, node.token)
+        if a.construct != INTEGER:
+            return node
 
-        return node
+        if (a.data != 0) == value:
+            if declares(b):
+                return node
+
+            return Node(INTEGER, int(value), node.token)
+
+        if b.construct != INTEGER:
+            return node
+
+        return Node(INTEGER, int(b.data != 0), node.token)
+
+    @node_optimizer(MODULO)
+    def __modulo(self, node):
+        return self.fold_int(node, modulo)
+
+    @node_optimizer(MULTIPLY)
+    def __multiply(self, node):
+        return self.fold_int(node, lambda a, b: a * b)
+
+    @node_optimizer(NOT_EQ)
+    def __not_eq(self, node):
+        return self.fold_equality(node, False)
+
+    @node_optimizer(SHIFT_L)
+    def __shift_l(self, node):
+        return self.fold_int(node, shift_left)
+
+    @node_optimizer(SHIFT_R)
+    def __shift_r(self, node):
+        return self.fold_int(node, shift_right)
+
+    @node_optimizer(SUBTRACT)
+    def __subtract(self, node):
+        return self.fold_int(node, lambda a, b: a - b)
@@ -0,0 +1,208 @@
+#-------------------------------------------------
+# IMPORTS
+#-------------------------------------------------
+
+from parsing.syntax import *
+from parsing.walker import walk
+
+from semantics.binder    import Binding, FUNCTION, PARAMETER
+from semantics.inference import direct_callee, TypeInference
+from semantics.variable  import STR
+
+#-------------------------------------------------
+# CONSTANTS
+#-------------------------------------------------
+
+# Constructs whose evaluation does more than compute a value, so that
+# evaluating them a different number of times would change the program.
+IMPURE = frozenset((ARRAY, ASSIGN, DEC, FUNC, FUNC_CALL, INC))
+
+#-------------------------------------------------
+# FUNCTIONS
+#-------------------------------------------------
+
+def nodes(root):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+
+        if node.children:
+            stack.extend(node.children)
+
+def is_pure(root):
+    return not any(node.construct in IMPURE for node in nodes(root))
+
+def copy_tree(node):
+    children = None
+    if node.children is not None:
+        children = [copy_tree(child) for child in node.children]
+
+    copy = Node(node.construct, node.data, node.token, children)
+    copy.binding = node.binding
+
+    return copy
+
+#-------------------------------------------------
+# CLASSES
+#-------------------------------------------------
+
+class Inliner(object):
+    # Replaces calls to small named functions that only return an expression
+    # with the expression, with the arguments in place of the parameters.
+    # Calls are expensive in batch: the function and its closure are looked
+    # up by name, and call then searches the file for the label.
+    #
+    # Only expressions using nothing but parameters, literals and named
+    # functions are inlined, so they mean the same thing at the call site.
+    # Arguments may end up evaluated any number of times, so they have to be
+    # pure, and literals if the expression makes calls (which could change the
+    # variables passed).  Functions calling themselves are never inlined.
+    #
+    # What + and == do depends on the types inferred for the parameters from
+    # all calls, so arguments must have the types of their parameters, and
+    # the calls to a function that isn't used as a value are either all
+    # inlined or none of them, since removing some would change the types.
+
+    def __init__(self, threshold, optimizer):
+        # The max number of nodes of an inlined expression.
+        self.threshold = threshold
+
+        # Folds the inlined expressions and whatever they are part of.
+        self.optimizer = optimizer
+
+        # The number of functions we are in.
+        self.depth = 0
+
+        # The calls to each function, and whether each of them can be inlined.
+        self.calls   = {}
+        self.inlined = set()
+
+    def inline(self, trees):
+        if self.threshold <= 0:
+            return
+
+        self.inference = TypeInference()
+        self.inference.infer(trees)
+
+        for tree in trees:
+            walk(tree, self.collect_call)
+
+        for callee, calls in self.calls.items():
+            ok = [node for node, can_inline in calls if can_inline]
+            if callee in self.inference.escaped or len(ok) == len(calls):
+                self.inlined.update(ok)
+
+        for tree in trees:
+            walk(tree, self.enter_node, self.leave_node)
+
+    def collect_call(self, node):
+        if node.construct != FUNC_CALL:
+            return
+
+        callee = direct_callee(node)
+        if callee:
+            self.calls.setdefault(callee, []).append((node, self.can_inline(node)))
+
+    def enter_node(self, node):
+        if node.construct == FUNC:
+            self.depth += 1
+
+    def leave_node(self, node):
+        c = node.construct
+
+        if c == FUNC:
+            self.depth -= 1
+        elif c == FUNC_CALL and node in self.inlined:
+            node = self.optimizer.optimize_ast(self.inline_call(node))
+
+        return self.optimizer.optimize_node(node)
+
+    def inlined_expr(self, func):
+        # The expression returned by the function, if it can be inlined.
+        body = func.children[1].children
+        if len(body) != 1 or body[0].construct != RETURN:
+            return None
+
+        expr = body[0].children[0]
+        for node in nodes(expr):
+            c = node.construct
+
+            if c in (ASSIGN, DEC, FUNC, INC):
+                return None
+
+            if c == IDENTIFIER:
+                if not node.binding:
+                    # The include and raw functions.
+                    return None
+
+                symbol = node.binding.symbol
+                if symbol.kind == PARAMETER and symbol.owner is not func:
+                    return None
+
+                if symbol.kind not in (FUNCTION, PARAMETER):
+                    return None
+
+        return expr
+
+    def can_inline(self, node):
+        callee = direct_callee(node)
+        if not callee.decl:
+            return False
+
+        func = callee.decl
+
+        expr = self.inlined_expr(func)
+        if not expr:
+            return False
+
+        calls = [n for n in nodes(expr) if n.construct == FUNC_CALL]
+        if any(direct_callee(call) is callee for call in calls):
+            return False
+
+        params = [param.binding.symbol for param in func.children[0].children]
+        args   = node.children[1:]
+
+        if len(args) > len(params):
+            return False
+
+        for param, arg in zip(params, args):
+            if not is_pure(arg) or (self.inference.type_of(arg) or STR) != param.type_:
+                return False
+
+            if calls and arg.construct not in (INTEGER, STRING):
+                return False
+
+        # Missing arguments are empty strings.
+        if any(param.type_ != STR for param in params[len(args):]):
+            return False
+
+        return sum(1 for _ in nodes(self.inline_call(node))) <= self.threshold
+
+    def inline_call(self, node):
+        func   = direct_callee(node).decl
+        params = [param.binding.symbol for param in func.children[0].children]
+        args   = node.children[1:]
+
+        values = {}
+        for i, param in enumerate(params):
+            values[param] = args[i] if i < len(args) else Node(STRING, '', node.token)
+
+        return self.copy_expr(self.inlined_expr(func), values)
+
+    def copy_expr(self, node, values):
+        if node.construct == IDENTIFIER:
+            symbol = node.binding.symbol
+            if symbol in values:
+                return copy_tree(values[symbol])
+
+            # Named functions are declared at the top level.
+            copy = Node(IDENTIFIER, node.data, node.token)
+            copy.binding = Binding(symbol, self.depth)
+            return copy
+
+        children = None
+        if node.children is not None:
+            children = [self.copy_expr(child, values) for child in node.children]
+
+        return Node(node.construct, node.data, node.token, children)
@@ -0,0 +1,203 @@
+#-------------------------------------------------
+# IMPORTS
+#-------------------------------------------------
+
+import re
+
+#-------------------------------------------------
+# CONSTANTS
+#-------------------------------------------------
+
+# The rules of PeepholeOptimizer, in the order they are tried (see rule()).
+RULES = []
+
+# The names of temporary variables (see Batch.tempvar()).
+TEMP = r'__(?:c_%~2|s_\w+)__\.__\d+'
+
+# Copies of values into temporary variables.  Only integers can be copied
+# with set /a, and parameters have to be expanded after the line is parsed.
+COPY = re.compile(r'set /a "({0})=(![^!" ]+!|%~\d|-?[1-9]\d*|0)"$|'
+                  r'set "({0})=(![^!" ]+!)"$'.format(TEMP))
+
+ARITHMETIC = re.compile(r'set /a "([^"]*)"$|set /a ([^" ]+)$')
+
+GOTO = re.compile(r'goto :?(\S+)$')
+
+# Merged set /a lines are kept well below the max length of a line.
+MAX_LINE = 1024
+
+#-------------------------------------------------
+# FUNCTIONS
+#-------------------------------------------------
+
+def rule(func):
+    # Rules are called with the lines of a segment and the index of a line,
+    # and return the number of lines from there to replace along with the
+    # lines to replace them with, or None to leave the lines as they are.
+    # They have to make the code shorter, so that optimizing ends.
+    RULES.append(func)
+    return func
+
+def command(lines, i):
+    # The line if it's a command of its own, None if it's continued on the
+    # next line with ^ or continues the one before.
+    if i < 0 or i >= len(lines):
+        return None
+
+    if lines[i].endswith('^') or (i > 0 and lines[i - 1].endswith('^')):
+        return None
+
+    return lines[i]
+
+def is_label(line):
+    return line.startswith(':')
+
+def is_simple(line):
+    # Whether the line is a command that doesn't open or close a block.
+    return not (is_label(line) or line.startswith(')') or line.endswith('('))
+
+def uses(line, name):
+    # The number of times the variable is used in the line.
+    return len(re.findall(re.escape(name) + r'(?![\w.])', line))
+
+def assigns(line, name):
+    # Whether the line is an unconditional assignment of the variable.
+    return re.match(r'(?:call )?set (?:/a )?"?' + re.escape(name) + '=', line) is not None
+
+def is_dead(lines, i, name):
+    # Whether the value of a temporary variable is never read after the line.
+    # Temporary variables are only used by the statement setting them, so
+    # their value is dead once they are assigned again.
+    for line in lines[i + 1:]:
+        if uses(line, name):
+            return assigns(line, name) and uses(line, name) == 1
+
+    return True
+
+#-------------------------------------------------
+# RULES
+#-------------------------------------------------
+
+@rule
+def propagate_copy(lines, i):
+    # set /a "t=!x!" followed by the only use of t: the value is used instead.
+    line = command(lines, i)
+    next_line = command(lines, i + 1)
+    if not line or not next_line:
+        return None
+
+    m = COPY.match(line)
+    if not m:
+        return None
+
+    name  = m.group(1) or m.group(3)
+    value = m.group(2) or m.group(4)
+
+    ref = '!{}!'.format(name)
+    if next_line.count(ref) != 1 or uses(next_line, name) != 1:
+        return None
+
+    if not is_dead(lines, i + 1, name):
+        return None
+
+    return 2, [next_line.replace(ref, value)]
+
+@rule
+def remove_jump_to_next(lines, i):
+    # goto x followed by the label x (and possibly others).
+    line = command(lines, i)
+    if not line:
+        return None
+
+    m = GOTO.match(line)
+    if not m or m.group(1).lower() == 'eof':
+        return None
+
+    j = i + 1
+    while j < len(lines) and is_label(lines[j]):
+        if lines[j][1:].strip() == m.group(1):
+            return 1, []
+
+        j += 1
+
+    return None
+
+@rule
+def remove_unreachable(lines, i):
+    # Commands after a goto that aren't labelled.  Lines opening or closing
+    # blocks are kept, along with what follows them.
+    line = command(lines, i)
+    if not line or not GOTO.match(line):
+        return None
+
+    j = i + 1
+    while command(lines, j) and is_simple(lines[j]):
+        j += 1
+
+    if j == i + 1:
+        return None
+
+    return j - i, [line]
+
+@rule
+def merge_arithmetic(lines, i):
+    # set /a "a=..." followed by set /a "b=..." is set /a "a=..., b=...",
+    # unless the second one mentions a, which it could expand before a is
+    # set.  Carets would be escapes in the merged line if only the other one
+    # expands variables.
+    line = command(lines, i)
+    next_line = command(lines, i + 1)
+    if not line or not next_line:
+        return None
+
+    a = ARITHMETIC.match(line)
+    b = ARITHMETIC.match(next_line)
+    if not a or not b or '^' in line or '^' in next_line:
+        return None
+
+    a = a.group(1) or a.group(2)
+    b = b.group(1) or b.group(2)
+
+    for part in a.split(','):
+        name = re.split(r'[-+*/%&|^<>]*=', part)[0].strip()
+        if not name or name in next_line:
+            return None
+
+    merged = 'set /a "{}, {}"'.format(a, b)
+    if len(merged) > MAX_LINE:
+        return None
+
+    return 2, [merged]
+
+#-------------------------------------------------
+# CLASSES
+#-------------------------------------------------
+
+class PeepholeOptimizer(object):
+    # Rewrites short sequences of generated lines into shorter ones, segment
+    # by segment, until no rule applies.  Rules are registered with rule(),
+    # and a different set can be passed to the constructor.
+
+    def __init__(self, rules=None):
+        self.rules = list(RULES if rules is None else rules)
+
+    def optimize(self, code):
+        lines = code.split('\n')
+
+        changed = True
+        while changed:
+            changed = False
+
+            for func in self.rules:
+                i = 0
+                while i < len(lines):
+                    result = func(lines, i)
+                    if result is None:
+                        i += 1
+                        continue
+
+                    n, new_lines = result
+                    lines[i:i + n] = new_lines
+                    changed = True
+
+        return '\n'.join(lines)
@@ -0,0 +1,65 @@
+#-------------------------------------------------
+# IMPORTS
+#-------------------------------------------------
+
+from parsing.syntax import *
+from parsing.walker import walk
+
+from semantics.inference import direct_callee
+
+#-------------------------------------------------
+# CLASSES
+#-------------------------------------------------
+
+class DeepRecursion(object):
+    # Marks the named functions that call themselves (symbol.deep) to have
+    # the code generator turn those calls into jumps, saving the variables of
+    # the function on a stack of environment variables instead of the stack
+    # of cmd, which only takes a few thousand nested calls.  Tail calls don't
+    # need the stack and are left to tail call elimination.
+    #
+    # Variables are saved by name, so marked functions are only compiled this
+    # way if they can't be re-entered through anything but the marked calls
+    # (see CaptureAnalysis).  Functions with nested functions, arrays or raw
+    # code are left alone, since objects are named after the call creating
+    # them and raw code could use the parameters of the call.
+
+    def __init__(self):
+        self.funcs = []
+
+    def mark(self, trees):
+        for tree in trees:
+            walk(tree, self.enter_node)
+
+        for func in self.funcs:
+            self.mark_func(func)
+
+    def enter_node(self, node):
+        if node.construct == FUNC and node.binding:
+            self.funcs.append(node)
+
+    def mark_func(self, func):
+        symbol = func.binding.symbol
+
+        recurses = False
+
+        stack = list(func.children[1].children)
+        while stack:
+            node = stack.pop()
+            c = node.construct
+
+            if c in (ARRAY, FUNC):
+                return
+
+            if c == FUNC_CALL:
+                ident = node.children[0]
+                if ident.construct == IDENTIFIER and ident.data == 'raw':
+                    return
+
+                if direct_callee(node) is symbol and not node.is_tail_call:
+                    recurses = True
+
+            if node.children:
+                stack.extend(node.children)
+
+        symbol.deep = recurses
@@ -0,0 +1,213 @@
+#-------------------------------------------------
+# IMPORTS
+#-------------------------------------------------
+
+from parsing.syntax import *
+from parsing.walker import SKIP, walk
+
+from semantics.binder import FUNCTION
+
+#-------------------------------------------------
+# FUNCTIONS
+#-------------------------------------------------
+
+def first_statement(node):
+    # The index of the first child of the node that is a statement (all the
+    # children after it are too), or None if none of them are.
+    c = node.construct
+
+    if c in (ELSE, FUNC_DEF, PROGRAM, THEN):
+        return 0
+    elif c == WHILE:
+        return 1
+    elif c == FOR:
+        return 3
+
+    return None
+
+def dotted_name(node):
+    # The name of a variable or (nested) property of one, e.g. 'a.b.c', or None
+    # if the node is anything else.
+    if node.construct == IDENTIFIER:
+        return node.data
+
+    if node.construct == ARRAY_IDX and node.children[1].construct == STRING:
+        s = dotted_name(node.children[0])
+        if s:
+            return s + '.' + node.children[1].data
+
+    return None
+
+def method_name(node):
+    # The name of the method defined by an assignment of a function to a
+    # property, i.e. obj.name = function (...) {...}, or None.
+    if node.construct != ASSIGN:
+        return None
+
+    target = node.children[0]
+    value  = node.children[1]
+
+    if target.construct != ARRAY_IDX or value.construct != FUNC:
+        return None
+
+    # Anything but plain names of objects could have side effects.
+    if not dotted_name(target):
+        return None
+
+    return target.children[1].data
+
+#-------------------------------------------------
+# CLASSES
+#-------------------------------------------------
+
+class TreeShaker(object):
+    # Removes code that can never run from a program and the files it includes:
+    # named functions that aren't referenced from code that can run, and
+    # methods (functions assigned to properties by statements) whose names are
+    # never used as property names.  Objects aren't tracked, so a method is
+    # kept if any object has a property by its name used anywhere.  Computed
+    # properties (obj[k]) could be any method, so all of them are kept if one
+    # is read.
+    #
+    # Starting from the top-level code of every file, the bodies of functions
+    # are walked as they become reachable until nothing more does.  The rest
+    # is removed.
+
+    def __init__(self):
+        # Named functions by symbol, the functions and method definitions each
+        # of them is nested in, and the names of methods by their definitions.
+        self.funcs     = {}
+        self.enclosing = {}
+        self.methods   = {}
+
+        self.containers = []
+
+        self.reached = set()
+        self.walked  = set()
+        self.used    = set()
+        self.targets = set()
+        self.pending = {}
+        self.queue   = []
+
+        # What was removed, as (kind, name) tuples.
+        self.removed = []
+
+    def shake(self, trees):
+        for tree in trees:
+            walk(tree, self.collect)
+
+        self.queue.extend(trees)
+        while self.queue:
+            walk(self.queue.pop(), self.enter_node)
+
+        for tree in trees:
+            walk(tree, self.enter_removed, self.leave_removed)
+
+    def reach(self, symbol):
+        if symbol in self.reached:
+            return
+
+        self.reached.add(symbol)
+
+        node = self.funcs.get(symbol)
+        if not node:
+            return
+
+        self.queue.append(node.children[1])
+
+        # The code of a function is emitted where it is declared, so whatever
+        # it is nested in has to be kept as well.
+        for container in self.enclosing[node]:
+            if container in self.methods:
+                self.use(self.methods[container])
+            elif container.binding:
+                self.reach(container.binding.symbol)
+            elif container not in self.walked:
+                self.walked.add(container)
+                self.queue.append(container.children[1])
+
+    def use(self, name):
+        if name in self.used:
+            return
+
+        self.used.add(name)
+        self.queue.extend(self.pending.pop(name, ()))
+
+    def collect(self, node):
+        i = first_statement(node)
+        if i is not None:
+            for child in node.children[i:]:
+                name = method_name(child)
+                if name:
+                    self.methods[child] = name
+
+        if node.construct == FUNC or node in self.methods:
+            return self.collect_container(node)
+
+    def collect_container(self, node):
+        if node.construct == FUNC and node.binding:
+            self.funcs[node.binding.symbol] = node
+            self.enclosing[node] = list(self.containers)
+
+        self.containers.append(node)
+
+        for child in node.children:
+            yield child
+
+        self.containers.pop()
+
+    def enter_node(self, node):
+        c = node.construct
+
+        # Named functions used as values rather than declared.
+        if node.children:
+            for child in node.children[:first_statement(node)]:
+                if child.construct == FUNC and child.binding:
+                    self.reach(child.binding.symbol)
+
+        if c == IDENTIFIER:
+            if node.binding and node.binding.symbol.kind == FUNCTION:
+                self.reach(node.binding.symbol)
+        elif c == FUNC:
+            # Named functions are walked once reached.
+            if node.binding or node in self.walked:
+                return SKIP
+
+            self.walked.add(node)
+        elif c == ASSIGN:
+            self.targets.add(node.children[0])
+
+            name = self.methods.get(node)
+            if name and name not in self.used:
+                self.pending.setdefault(name, []).append(node)
+                return SKIP
+        elif c == ARRAY_IDX:
+            key = node.children[1]
+            if key.construct == STRING:
+                self.use(key.data)
+            elif key.construct != INTEGER and node not in self.targets:
+                for name in set(self.methods.values()):
+                    self.use(name)
+        elif c == FUNC_CALL:
+            func = node.children[0]
+            if func.construct == IDENTIFIER and func.data in ('include', 'raw'):
+                return SKIP
+
+    def is_removed(self, node):
+        if node.construct == FUNC:
+            return node.binding and node.binding.symbol not in self.reached
+
+        return node in self.methods and self.methods[node] not in self.used
+
+    def enter_removed(self, node):
+        if self.is_removed(node):
+            return SKIP
+
+    def leave_removed(self, node):
+        if not self.is_removed(node):
+            return node
+
+        if node.construct == FUNC:
+            self.removed.append(('function', node.data))
+        else:
+            self.removed.append(('method', dotted_name(node.children[0])))
@@ -0,0 +1,92 @@
+#-------------------------------------------------
+# IMPORTS
+#-------------------------------------------------
+
+from parsing.syntax import *
+from parsing.walker import walk
+
+from semantics.inference import direct_callee
+
+#-------------------------------------------------
+# FUNCTIONS
+#-------------------------------------------------
+
+def last_statements(body):
+    # The statements that are the last to run in a list of statements, i.e.
+    # the last one, or the last ones of the branches of an if statement.
+    if not body.children:
+        return
+
+    node = body.children[-1]
+    if node.construct == IF:
+        for s in last_statements(node.children[1]):
+            yield s
+        for s in last_statements(node.children[2]):
+            yield s
+    else:
+        yield node
+
+#-------------------------------------------------
+# CLASSES
+#-------------------------------------------------
+
+class TailCallElimination(object):
+    # Finds the calls named functions make to themselves as the last thing
+    # they do, and marks them (node.is_tail_call) along with the functions
+    # (symbol.tail_calls).  The code generator turns those calls into a jump
+    # back to the start of the function with the parameters set to the
+    # arguments, so recursion like that runs in a loop instead of nested
+    # calls.
+    #
+    # return f(...) is always a tail call.  A call that is the last statement
+    # is one too if the function has no return statements, since both the
+    # function and the call return zero then.  Functions with nested
+    # functions or raw code are left alone, as those could use the
+    # parameters of the call after they have been set for the next one.
+
+    def __init__(self):
+        self.funcs = []
+
+    def eliminate(self, trees):
+        for tree in trees:
+            walk(tree, self.enter_node)
+
+        for func in self.funcs:
+            self.mark_tail_calls(func)
+
+    def enter_node(self, node):
+        if node.construct == FUNC and node.binding:
+            self.funcs.append(node)
+
+    def mark_tail_calls(self, func):
+        symbol = func.binding.symbol
+        body   = func.children[1]
+
+        returns = []
+
+        stack = list(body.children)
+        while stack:
+            node = stack.pop()
+            c = node.construct
+
+            if c == FUNC:
+                return
+
+            if c == FUNC_CALL:
+                ident = node.children[0]
+                if ident.construct == IDENTIFIER and ident.data == 'raw':
+                    return
+            elif c == RETURN:
+                returns.append(node)
+
+            if node.children:
+                stack.extend(node.children)
+
+        calls = [node.children[0] for node in returns]
+        if not returns:
+            calls = list(last_statements(body))
+
+        for node in calls:
+            if node.construct == FUNC_CALL and direct_callee(node) is symbol:
+                node.is_tail_call = True
+                symbol.tail_calls = True
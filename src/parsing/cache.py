@@ -0,0 +1,97 @@
+#--------------------------------------------------
+# IMPORTS
+#--------------------------------------------------
+
+import cPickle
+import hashlib
+import os
+
+import mshl
+
+from .parser import Parser
+
+from lexing.lexer  import create_lexer
+from lexing.source import FileSource
+
+#--------------------------------------------------
+# CONSTANTS
+#--------------------------------------------------
+
+# Bump when the pickled syntax tree format changes.
+CACHE_FORMAT = 3
+
+#--------------------------------------------------
+# FUNCTIONS
+#--------------------------------------------------
+
+def cache_file_name(source):
+    cache_dir = mshl.conf and mshl.conf.option('--cache-dir')
+    if not cache_dir:
+        return None
+
+    key = hashlib.sha1()
+    key.update('{}:{}:'.format(mshl.VERSION, CACHE_FORMAT))
+    key.update(source.string)
+
+    return os.path.join(cache_dir, key.hexdigest() + '.ast')
+
+def load_tree(file_name, lines):
+    try:
+        with open(file_name, 'rb') as f:
+            tree = cPickle.load(f)
+    except Exception:
+        # Missing or broken cache files are simply parsed again.
+        return None
+
+    # Tokens are stored without their line table since it belongs to the
+    # source they were read from.
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.token:
+            node.token.lines = lines
+        if node.children:
+            stack.extend(node.children)
+
+    return tree
+
+def store_tree(file_name, tree):
+    temp_file_name = '{}.{}'.format(file_name, os.getpid())
+
+    try:
+        if not os.path.isdir(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+
+        with open(temp_file_name, 'wb') as f:
+            cPickle.dump(tree, f, cPickle.HIGHEST_PROTOCOL)
+
+        os.rename(temp_file_name, file_name)
+    except Exception:
+        # The cache is only an optimization, so we don't care if it fails.
+        if os.path.isfile(temp_file_name):
+            os.remove(temp_file_name)
+
+def generate_ast(file_name):
+    # Parses the specified file.  If a cache directory has been specified, the
+    # syntax tree is cached there, keyed by the contents of the file and the
+    # compiler version, so unchanged files are never lexed or parsed again.
+    with FileSource(file_name) as source:
+        cache_file = cache_file_name(source)
+        if cache_file:
+            tree = load_tree(cache_file, source.lines)
+            if tree:
+                return tree
+
+        num_errors   = mshl.num_errors
+        num_warnings = mshl.num_warnings
+
+        tree = Parser(create_lexer(source)).generate_ast()
+
+    # Trees with errors or warnings aren't cached, or they would not be
+    # reported on the next run.
+    if (cache_file
+    and mshl.num_errors == num_errors
+    and mshl.num_warnings == num_warnings):
+        store_tree(cache_file, tree)
+
+    return tree
@@ -0,0 +1,84 @@
+#--------------------------------------------------
+# IMPORTS
+#--------------------------------------------------
+
+import collections
+import os
+
+import mshl
+
+from . import syntax
+
+from .cache import generate_ast
+
+#--------------------------------------------------
+# FUNCTIONS
+#--------------------------------------------------
+
+def find_includes(tree):
+    # Returns the names of the files included by include('...') calls anywhere
+    # in the tree, in source order.  Calls with anything else than a string
+    # literal are left to the semantic analyzer to report.  Trees of files
+    # with syntax errors have None in place of what couldn't be parsed.
+    names = []
+
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+
+        if (node.construct == syntax.FUNC_CALL
+        and len(node.children) == 2
+        and node.children[0].construct == syntax.IDENTIFIER
+        and node.children[0].data == 'include'
+        and node.children[1].construct == syntax.STRING):
+            names.append(node.children[1].data)
+
+        if node.children:
+            stack.extend(reversed(node.children))
+
+    return names
+
+#--------------------------------------------------
+# CLASSES
+#--------------------------------------------------
+
+class Module(object):
+    def __init__(self, file_name, tree):
+        self.file_name = file_name
+        self.tree      = tree
+
+        # Modules included by this one.
+        self.includes = []
+
+class ModuleGraph(object):
+    # All files that make up a program.  Every file is parsed exactly once and
+    # the same syntax tree is then analyzed, optimized and compiled, no matter
+    # how many times (or from where) it is included.
+
+    def __init__(self):
+        self.modules = collections.OrderedDict()
+
+    def __iter__(self):
+        return iter(self.modules.values())
+
+    def load(self, file_name):
+        key = os.path.abspath(file_name)
+        if key in self.modules:
+            return self.modules[key]
+
+        old_srcfile = mshl.srcfile
+        mshl.srcfile = file_name
+        module = Module(file_name, generate_ast(file_name))
+        mshl.srcfile = old_srcfile
+
+        # Added before loading includes so that include cycles end here.
+        self.modules[key] = module
+
+        for name in find_includes(module.tree):
+            s = mshl.find_include_file(name)
+            if s:
+                module.includes.append(self.load(s))
+
+        return module
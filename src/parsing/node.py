@@ -1,10 +1,25 @@
 #--------------------------------------------------
-# IMPORTS
+# CLASSES
 #--------------------------------------------------
 
 class Node(object):
+    # Syntax trees of large programs hold a lot of nodes, so they have no
+    # per-instance dict.  Attributes set by later passes need a slot here.
+    __slots__ = ('binding', 'children', 'construct', 'data', 'token', 'is_unused',
+                 'is_tail_call', 'scope')
+
     def __init__(self, construct, data=None, token=None, children=None):
         self.children  = children
         self.construct = construct
         self.data      = data
         self.token     = token
+
+        # Set during semantic analysis.
+        self.is_unused = False
+        self.scope     = None
+
+        # Set by the binder (identifiers and named functions).
+        self.binding = None
+
+        # Set by tail call elimination (calls).
+        self.is_tail_call = False
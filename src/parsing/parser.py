@@ -7,7 +7,8 @@ import mshl
 from .node   import Node
 from .syntax import PROGRAM, parse_expr
 
-from lexing import lexemes
+from lexing        import lexemes
+from lexing.stream import TokenStream
 
 #--------------------------------------------------
 # CONSTANTS
@@ -21,22 +22,20 @@ DEFAULT_MAX_ERRORS = 10
 
 class Parser(object):
     def __init__(self, lexer):
-        self.lexer = lexer
+        self.lexer  = lexer
+        self.tokens = TokenStream(lexer)
 
         self.errors = []
         self.max_errors = DEFAULT_MAX_ERRORS
 
-        self.peeked_token = None
-
     def eat_whitespace(self, eat_semicolons=False):
-        tok = self.peek_token()
         if eat_semicolons:
             cats = (lexemes.NEWLINE, lexemes.SEMICOLON)
         else:
             cats = (lexemes.NEWLINE,)
-        while tok.category in cats:
-            self.read_token()
-            tok = self.peek_token()
+
+        while self.tokens.peek().category in cats:
+            self.tokens.read()
 
     def expect(self, *args):
         tokens = []
@@ -45,7 +44,7 @@ class Parser(object):
             token = self.read_token()
 
             if token.category != lexeme:
-                mshl.error('expected {}'.format(lexeme), token)
+                mshl.error('expected {}'.format(lexemes.NAMES[lexeme]), token)
 
             tokens.append(token)
 
@@ -69,36 +68,12 @@ class Parser(object):
         return Node(PROGRAM, children=expressions)
 
     def parse_expression(self):
-        tok = self.peek_token()
-        while tok.category == lexemes.NEWLINE:
-            self.read_token()
-            tok = self.peek_token()
+        self.eat_whitespace()
 
         return parse_expr(self)
 
-    def peek_token(self):
-        if not self.peeked_token:
-            self.peeked_token = self.read_token()
-
-        return self.peeked_token
+    def peek_token(self, k=1):
+        return self.tokens.peek(k)
 
     def read_token(self):
-        if self.peeked_token:
-            tok = self.peeked_token
-            self.peeked_token = None
-            return tok
-
-        tok = self.lexer.read_token()
-        while tok.category == lexemes.COMMENT:
-            tok = self.lexer.read_token()
-        #if tok.category == lexemes.SLASH_2:
-        #    self.lexer.read_token()
-        #    while tok.category not in (lexemes.EOF, lexemes.NEWLINE):
-        #        tok = self.lexer.read_token()
-        #elif tok.category == lexemes.SLASH_ASTERISK:
-        #    self.lexer.read_token()
-        #    while tok.category not in (lexemes.ASTERISK_SLASH, lexemes.EOF):
-        #        tok = self.lexer.read_token()
-        #    tok = self.lexer.read_token()
-
-        return tok
+        return self.tokens.read()
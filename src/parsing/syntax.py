@@ -8,54 +8,124 @@ from .node import Node
 
 from lexing import lexemes
 
+#--------------------------------------------------
+# FUNCTIONS
+#--------------------------------------------------
+
+# Node constructs are stored as small integers.  NAMES maps them back to
+# readable names for error messages and AST dumps.
+NAMES = []
+
+def construct(name):
+    NAMES.append(name)
+    return len(NAMES) - 1
+
 #--------------------------------------------------
 # CONSTANTS
 #--------------------------------------------------
 
-ADD          = 'add'
-ARRAY        = 'array'
-ARRAY_IDX    = 'array index'
-ASSIGN       = 'assign'
-BIN_AND      = 'binary and'
-BIN_OR       = 'binary or'
-BIN_XOR      = 'binary xor'
-BREAK        = 'break'
-CONTINUE     = 'continue'
-DEC          = 'decrement'
-DIVIDE       = 'divide'
-ELSE         = 'else'
-END          = 'end'
-EQUAL        = 'equal'
-EQUAL_UNDEF  = 'equals undefined'
-FOR          = 'for'
-FUNC         = 'func'
-FUNC_CALL    = 'func call'
-FUNC_DECL    = 'func decl'
-FUNC_DEF     = 'func def'
-GREATER      = 'greater'
-GREATER_EQ   = 'greater or eq'
-IDENTIFIER   = 'ident'
-IF           = 'if'
-IF_TERNARY   = 'if ternary'
-INC          = 'increment'
-INTEGER      = 'integer'
-LESS         = 'less'
-LESS_EQ      = 'less or equal'
-LOGIC_AND    = 'logic and'
-LOGIC_OR     = 'logic or'
-MODULO       = 'modulo'
-MULTIPLY     = 'multiply'
-NOOP         = 'no-op'
-NOT_EQ       = 'not equal'
-NOT_EQ_UNDEF = 'not equal undefined'
-PROGRAM      = 'program'
-RETURN       = 'return'
-SHIFT_L      = 'left-shift'
-SHIFT_R      = 'right-shift'
-STRING       = 'string'
-SUBTRACT     = 'subtract'
-THEN         = 'then'
-WHILE        = 'while'
+ADD          = construct('add')
+ARRAY        = construct('array')
+ARRAY_IDX    = construct('array index')
+ASSIGN       = construct('assign')
+BIN_AND      = construct('binary and')
+BIN_OR       = construct('binary or')
+BIN_XOR      = construct('binary xor')
+BREAK        = construct('break')
+CONTINUE     = construct('continue')
+DEC          = construct('decrement')
+DIVIDE       = construct('divide')
+ELSE         = construct('else')
+END          = construct('end')
+EQUAL        = construct('equal')
+EQUAL_UNDEF  = construct('equals undefined')
+FOR          = construct('for')
+FUNC         = construct('func')
+FUNC_CALL    = construct('func call')
+FUNC_DECL    = construct('func decl')
+FUNC_DEF     = construct('func def')
+GREATER      = construct('greater')
+GREATER_EQ   = construct('greater or eq')
+IDENTIFIER   = construct('ident')
+IF           = construct('if')
+IF_TERNARY   = construct('if ternary')
+INC          = construct('increment')
+INTEGER      = construct('integer')
+LESS         = construct('less')
+LESS_EQ      = construct('less or equal')
+LOGIC_AND    = construct('logic and')
+LOGIC_OR     = construct('logic or')
+MODULO       = construct('modulo')
+MULTIPLY     = construct('multiply')
+NOOP         = construct('no-op')
+NOT_EQ       = construct('not equal')
+NOT_EQ_UNDEF = construct('not equal undefined')
+PROGRAM      = construct('program')
+RETURN       = construct('return')
+SHIFT_L      = construct('left-shift')
+SHIFT_R      = construct('right-shift')
+STRING       = construct('string')
+SUBTRACT     = construct('subtract')
+THEN         = construct('then')
+WHILE        = construct('while')
+
+# Operator precedence, from loosest to tightest binding.
+PREC_ASSIGN    = 1
+PREC_TERNARY   = 2
+PREC_LOGIC_OR  = 3
+PREC_LOGIC_AND = 4
+PREC_BIN_OR    = 5
+PREC_BIN_XOR   = 6
+PREC_BIN_AND   = 7
+PREC_EQUALITY  = 8
+PREC_RELATION  = 9
+PREC_SHIFT     = 10
+PREC_ADDITIVE  = 11
+PREC_MULTIPLY  = 12
+
+# Left-associative binary operators: token category -> (precedence, construct)
+BINARY_OPS = {
+    lexemes.LOGIC_OR   : (PREC_LOGIC_OR , LOGIC_OR),
+    lexemes.LOGIC_AND  : (PREC_LOGIC_AND, LOGIC_AND),
+    lexemes.BIN_OR     : (PREC_BIN_OR   , BIN_OR),
+    lexemes.BIN_XOR    : (PREC_BIN_XOR  , BIN_XOR),
+    lexemes.BIN_AND    : (PREC_BIN_AND  , BIN_AND),
+    lexemes.EQ_SIGN_2  : (PREC_EQUALITY , EQUAL),
+    lexemes.NOT_EQ     : (PREC_EQUALITY , NOT_EQ),
+    lexemes.LESS       : (PREC_RELATION , LESS),
+    lexemes.GREATER    : (PREC_RELATION , GREATER),
+    lexemes.LESS_EQ    : (PREC_RELATION , LESS_EQ),
+    lexemes.GREATER_EQ : (PREC_RELATION , GREATER_EQ),
+    lexemes.SHIFT_L    : (PREC_SHIFT    , SHIFT_L),
+    lexemes.SHIFT_R    : (PREC_SHIFT    , SHIFT_R),
+    lexemes.PLUS_SIGN  : (PREC_ADDITIVE , ADD),
+    lexemes.MINUS_SIGN : (PREC_ADDITIVE , SUBTRACT),
+    lexemes.ASTERISK   : (PREC_MULTIPLY , MULTIPLY),
+    lexemes.SLASH      : (PREC_MULTIPLY , DIVIDE),
+    lexemes.MODULO     : (PREC_MULTIPLY , MODULO),
+}
+
+# Right-associative assignment operators: token category -> construct applied
+# to the assigned expression and the value (None for plain assignment).
+ASSIGN_OPS = {
+    lexemes.EQ_SIGN     : None,
+    lexemes.PLUS_EQ     : ADD,
+    lexemes.MINUS_EQ    : SUBTRACT,
+    lexemes.ASTERISK_EQ : MULTIPLY,
+    lexemes.SLASH_EQ    : DIVIDE,
+    lexemes.MODULO_EQ   : MODULO,
+    lexemes.BIN_AND_EQ  : BIN_AND,
+    lexemes.BIN_OR_EQ   : BIN_OR,
+    lexemes.BIN_XOR_EQ  : BIN_XOR,
+    lexemes.SHIFT_L_EQ  : SHIFT_L,
+    lexemes.SHIFT_R_EQ  : SHIFT_R,
+}
+
+# Comparisons with undefined have constructs of their own.
+UNDEF_OPS = {
+    EQUAL  : EQUAL_UNDEF,
+    NOT_EQ : NOT_EQ_UNDEF,
+}
 
 #--------------------------------------------------
 # FUNCTIONS
@@ -63,296 +133,128 @@ WHILE        = 'while'
 
 def parse_expr(parser):
     parser.eat_whitespace()
-    expr = parse_expr2(parser)
+    expr = parse_binary(parser, PREC_ASSIGN)
     parser.eat_whitespace()
 
-    tok = parser.peek_token()
-
-    # <expr2> = <expr>
-    if tok.category == lexemes.EQ_SIGN:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[expr, parse_expr(parser)])
-
-    # <expr2> + <expr>
-    if tok.category == lexemes.PLUS_SIGN:
-        parser.read_token()
-        expr = Node(ADD, children=[expr, parse_expr(parser)])
-
-    # <expr2> - <expr>
-    elif tok.category == lexemes.MINUS_SIGN:
-        parser.read_token()
-        expr = Node(SUBTRACT, children=[expr, parse_expr(parser)])
-
-    # <expr2> & <expr>
-    elif tok.category == lexemes.BIN_AND:
-        parser.read_token()
-        expr = Node(BIN_AND, children=[expr, parse_expr(parser)])
-
-    # <expr2> | <expr>
-    elif tok.category == lexemes.BIN_OR:
-        parser.read_token()
-        expr = Node(BIN_OR, children=[expr, parse_expr(parser)])
-
-    # <expr2> ^ <expr>
-    elif tok.category == lexemes.BIN_XOR:
-        parser.read_token()
-        expr = Node(BIN_XOR, children=[expr, parse_expr(parser)])
-
-    # <expr2> && <expr>
-    elif tok.category == lexemes.LOGIC_AND:
-        parser.read_token()
-        expr = Node(LOGIC_AND, children=[expr, parse_expr(parser)])
-
-    # <expr2> || <expr>
-    elif tok.category == lexemes.LOGIC_OR:
-        parser.read_token()
-        expr = Node(LOGIC_OR, children=[expr, parse_expr(parser)])
-
-    # <expr2> ? <expr> : <expr>
-    elif tok.category == lexemes.Q_MARK:
-        parser.read_token()
-        parser.eat_whitespace()
-        then_expr = parse_expr(parser)
-        parser.eat_whitespace()
-        parser.expect(lexemes.COLON)
-        parser.eat_whitespace()
-        else_expr = parse_expr(parser)
-        expr = Node(IF_TERNARY, children=[expr, then_expr, else_expr])
-
-    if expr:
-        expr.token = tok
-
     return expr
 
-def parse_expr2(parser):
-    parser.eat_whitespace()
-    expr = parse_expr3(parser)
-
-    tok = parser.peek_token()
-
-    # <expr3>++
-    if tok.category == lexemes.PLUS_PLUS:
-        parser.read_token()
-        expr = Node(INC, children=[expr])
-
-    # <expr3>--
-    elif tok.category == lexemes.MINUS_MINUS:
-        parser.read_token()
-        expr = Node(DEC, children=[expr])
-
-    tok = parser.peek_token()
-
-    # <expr3> * <expr2>
-    if tok.category == lexemes.ASTERISK:
-        parser.read_token()
-        expr = Node(MULTIPLY, children=[expr, parse_expr2(parser)])
-
-    # <expr3> / <expr2>
-    elif tok.category == lexemes.SLASH:
-        parser.read_token()
-        expr = Node(DIVIDE, children=[expr, parse_expr2(parser)])
-
-    # <expr3> % <expr2>
-    elif tok.category == lexemes.MODULO:
-        parser.read_token()
-        expr = Node(MODULO, children=[expr, parse_expr2(parser)])
-
-    # <expr3> << <expr2>
-    elif tok.category == lexemes.SHIFT_L:
-        parser.read_token()
-        expr = Node(SHIFT_L, children=[expr, parse_expr2(parser)])
-
-    # <expr3> >> <expr2>
-    elif tok.category == lexemes.SHIFT_R:
-        parser.read_token()
-        expr = Node(SHIFT_R, children=[expr, parse_expr2(parser)])
-
-    # <expr3> += <expr2>
-    elif tok.category == lexemes.PLUS_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(ADD, children=[expr, parse_expr2(parser)])
-        ])
-
-    # <expr3> -= <expr2>
-    elif tok.category == lexemes.MINUS_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(SUBTRACT, children=[expr, parse_expr2(parser)])
-        ])
-
-    # <expr3> *= <expr2>
-    elif tok.category == lexemes.ASTERISK_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(MULTIPLY, children=[expr, parse_expr2(parser)])
-        ])
-
-    # <expr3> /= <expr2>
-    elif tok.category == lexemes.SLASH_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(DIVIDE, children=[expr, parse_expr2(parser)])
-        ])
-
-    # <expr3> %= <expr2>
-    elif tok.category == lexemes.MODULO_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(MODULO, children=[expr, parse_expr2(parser)])
-        ])
+def parse_binary(parser, min_prec):
+    # Precedence climbing: operators of the same precedence are handled by the
+    # loop, so the recursion depth only depends on the number of precedence
+    # levels and the nesting of the expression, not on its length.
+    expr = parse_postfix(parser)
 
-    # <expr3> &= <expr2>
-    elif tok.category == lexemes.BIN_AND_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(BIN_AND, children=[expr, parse_expr2(parser)])
-        ])
+    while True:
+        parser.eat_whitespace()
+        tok = parser.peek_token()
 
-    # <expr3> |= <expr2>
-    elif tok.category == lexemes.BIN_OR_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(BIN_OR, children=[expr, parse_expr2(parser)])
-        ])
+        # <expr> = <expr>, <expr> += <expr> etc.
+        if tok.category in ASSIGN_OPS:
+            if min_prec > PREC_ASSIGN:
+                break
 
-    # <expr3> ^= <expr2>
-    elif tok.category == lexemes.BIN_XOR_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(BIN_XOR, children=[expr, parse_expr2(parser)])
-        ])
+            parser.read_token()
+            value = parse_binary(parser, PREC_ASSIGN)
 
-    # <expr3> <<= <expr2>
-    elif tok.category == lexemes.SHIFT_L_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(SHIFT_L, children=[expr, parse_expr2(parser)])
-        ])
+            op = ASSIGN_OPS[tok.category]
+            if op is not None:
+                value = Node(op, token=tok, children=[expr, value])
 
-    # <expr3> >>= <expr2>
-    elif tok.category == lexemes.SHIFT_R_EQ:
-        parser.read_token()
-        expr = Node(ASSIGN, children=[
-            expr,
-            Node(SHIFT_R, children=[expr, parse_expr2(parser)])
-        ])
+            expr = Node(ASSIGN, token=tok, children=[expr, value])
 
-    # <expr3> == <expr>
-    elif tok.category == lexemes.EQ_SIGN_2:
-        parser.read_token()
+        # <expr> ? <expr> : <expr>
+        elif tok.category == lexemes.Q_MARK:
+            if min_prec > PREC_TERNARY:
+                break
 
-        tok = parser.peek_token()
-        if tok.category == lexemes.UNDEFINED:
             parser.read_token()
-            expr = Node(EQUAL_UNDEF, children=[expr])
-        else:
-            expr = Node(EQUAL, children=[expr, parse_expr3(parser)])
-
-    # <expr3> != <expr>
-    elif tok.category == lexemes.NOT_EQ:
-        parser.read_token()
+            then_expr = parse_expr(parser)
+            parser.expect(lexemes.COLON)
+            parser.eat_whitespace()
+            else_expr = parse_binary(parser, PREC_TERNARY)
 
-        tok = parser.peek_token()
-        if tok.category == lexemes.UNDEFINED:
-            parser.read_token()
-            expr = Node(NOT_EQ_UNDEF, children=[expr])
-        else:
-            expr = Node(NOT_EQ, children=[expr, parse_expr3(parser)])
+            expr = Node(IF_TERNARY, token=tok, children=[expr, then_expr, else_expr])
 
-    # <expr3> < <expr>
-    elif tok.category == lexemes.LESS:
-        parser.read_token()
-        expr = Node(LESS, children=[expr, parse_expr3(parser)])
+        # <expr> <op> <expr>
+        elif tok.category in BINARY_OPS:
+            prec, op = BINARY_OPS[tok.category]
+            if prec < min_prec:
+                break
 
-    # <expr3> > <expr>
-    elif tok.category == lexemes.GREATER:
-        parser.read_token()
-        expr = Node(GREATER, children=[expr, parse_expr3(parser)])
+            parser.read_token()
+            parser.eat_whitespace()
 
-    # <expr3> <= <expr>
-    elif tok.category == lexemes.LESS_EQ:
-        parser.read_token()
-        expr = Node(LESS_EQ, children=[expr, parse_expr3(parser)])
+            # <expr> == undefined, <expr> != undefined
+            if (op in UNDEF_OPS
+            and parser.peek_token().category == lexemes.UNDEFINED):
+                parser.read_token()
+                expr = Node(UNDEF_OPS[op], token=tok, children=[expr])
+                continue
 
-    # <expr3> >= <expr>
-    elif tok.category == lexemes.GREATER_EQ:
-        parser.read_token()
-        expr = Node(GREATER_EQ, children=[expr, parse_expr3(parser)])
+            value = parse_binary(parser, prec+1)
+            expr = Node(op, token=tok, children=[expr, value])
 
-    if expr:
-        expr.token = tok
+        else:
+            break
 
     return expr
 
-def parse_expr3(parser):
+def parse_postfix(parser):
     parser.eat_whitespace()
-    expr = parse_expr4(parser)
+    expr = parse_primary(parser)
 
-    tok = parser.peek_token()
+    while True:
+        tok = parser.peek_token()
 
-    # <expr3> (<expr>[, <expr> ...])
-    if tok.category == lexemes.L_PAREN:
-        while True:
-            parser.expect(lexemes.L_PAREN)
+        # <expr>(<expr>[, <expr> ...])
+        if tok.category == lexemes.L_PAREN:
+            parser.read_token()
             args = [expr]
             while True:
-                tok = parser.peek_token()
-                if tok.category == lexemes.R_PAREN:
+                parser.eat_whitespace()
+
+                if parser.peek_token().category == lexemes.R_PAREN:
                     break
 
                 args.append(parse_expr(parser))
 
-                tok = parser.peek_token()
-                if tok.category == lexemes.R_PAREN:
+                if parser.peek_token().category == lexemes.R_PAREN:
                     break
 
                 parser.expect(lexemes.COMMA)
 
             parser.expect(lexemes.R_PAREN)
 
-            if len(args) == 0:
-                args = None
-
             expr = Node(FUNC_CALL, token=tok, children=args)
 
-            tok = parser.peek_token()
-            if tok.category != lexemes.L_PAREN:
-                break
+        # <expr>[<expr>]
+        elif tok.category == lexemes.L_BRACK:
+            parser.read_token()
+            expr = Node(ARRAY_IDX, token=tok, children=[expr, parse_expr(parser)])
+            parser.expect(lexemes.R_BRACK)
 
-    # <expr3>[<expr>]
-    elif tok.category == lexemes.L_BRACK:
-        while True:
-            tok = parser.peek_token()
-            if tok.category == lexemes.L_BRACK:
-                parser.read_token()
-                expr = Node(ARRAY_IDX, token=tok, children=[expr, parse_expr(parser)])
-                parser.expect(lexemes.R_BRACK)
-            elif tok.category == lexemes.PERIOD:
-                parser.read_token()
-                tok = parser.expect(lexemes.IDENT)
-                expr = Node(ARRAY_IDX, token=tok, children=[expr, Node(STRING, tok.lexeme, tok)])
-                tok = parser.peek_token()
+        # <expr>.<identifier>
+        elif tok.category == lexemes.PERIOD:
+            parser.read_token()
+            tok = parser.expect(lexemes.IDENT)
+            expr = Node(ARRAY_IDX, token=tok, children=[expr, Node(STRING, tok.lexeme, tok)])
 
-            tok = parser.peek_token()
-            if tok.category not in (lexemes.L_BRACK, lexemes.PERIOD):
-                break
+        # <expr>++
+        elif tok.category == lexemes.PLUS_PLUS:
+            parser.read_token()
+            expr = Node(INC, token=tok, children=[expr])
 
-    if expr:
-        expr.token = tok
+        # <expr>--
+        elif tok.category == lexemes.MINUS_MINUS:
+            parser.read_token()
+            expr = Node(DEC, token=tok, children=[expr])
+
+        else:
+            break
 
     return expr
 
-def parse_expr4(parser):
+def parse_primary(parser):
     parser.eat_whitespace()
     expr = None
 
@@ -428,13 +330,12 @@ def parse_expr4(parser):
     elif tok.category == lexemes.RETURN:
         parser.read_token()
 
-        newline_after_return = False
-        if parser.peek_token().category == lexemes.NEWLINE:
-            newline_after_return = True
+        # Newlines are collapsed by the token stream, so whatever follows the
+        # return keyword is at most two tokens ahead.
+        newline_after_return = parser.peek_token().category == lexemes.NEWLINE
+        k = 2 if newline_after_return else 1
 
-        parser.eat_whitespace()
-
-        if parser.peek_token().category in (lexemes.R_BRACE, lexemes.SEMICOLON):
+        if parser.peek_token(k).category in (lexemes.R_BRACE, lexemes.SEMICOLON):
             expr = Node(RETURN, children=[Node(INTEGER, 0, tok)])
         else:
             if newline_after_return:
@@ -457,10 +358,10 @@ def parse_expr4(parser):
     #    expr = Node(INTEGER, 0)
     #    mshl.warning('undefined should only be used in equality tests')
 
+    # !<expr>
     elif tok.category == lexemes.NOT:
         parser.read_token()
-        parser.eat_whitespace()
-        expr = parse_expr(parser)
+        expr = parse_postfix(parser)
         expr = Node(IF_TERNARY, children=[expr, Node(INTEGER, 0, tok), Node(INTEGER, 1, tok)])
 
     elif tok.category == lexemes.BREAK:
@@ -477,7 +378,7 @@ def parse_expr4(parser):
 
     elif tok.category != lexemes.EOF:
         parser.read_token()
-        mshl.error("unexpected token: {}".format(tok.category), tok)
+        mshl.error("unexpected token: {}".format(lexemes.NAMES[tok.category]), tok)
 
     if expr:
         expr.token = tok
@@ -616,7 +517,7 @@ def parse_ident(parser):
     return ident
 
 def parse_if(parser):
-    if_tok = parser.expect(lexemes.IF, lexemes.L_PAREN)
+    if_tok = parser.expect(lexemes.IF, lexemes.L_PAREN)[0]
 
     cond = parse_expr(parser)
 
@@ -0,0 +1,103 @@
+#--------------------------------------------------
+# IMPORTS
+#--------------------------------------------------
+
+import types
+
+#--------------------------------------------------
+# CONSTANTS
+#--------------------------------------------------
+
+# Returned by an enter hook to leave the node without walking its children.
+SKIP = 'skip'
+
+#--------------------------------------------------
+# FUNCTIONS
+#--------------------------------------------------
+
+def dispatch_table(cls, attr):
+    # Maps the value of attr to the function of each method of cls that has
+    # the attribute (set by decorators like @code_emitter).  The table is built
+    # once per class and then stored on the class.
+    name = '_dispatch' + attr
+    if name in cls.__dict__:
+        return cls.__dict__[name]
+
+    table = {}
+    for s in dir(cls):
+        func = getattr(cls, s, None)
+        if not hasattr(func, attr):
+            continue
+
+        table[getattr(func, attr)] = getattr(func, '__func__', func)
+
+    setattr(cls, name, table)
+
+    return table
+
+def walk(root, enter=None, leave=None):
+    # Walks the tree depth-first using a stack of its own instead of recursing,
+    # so trees of any depth can be walked.
+    #
+    # enter(node) is called before the children of the node are walked.  It
+    # can return SKIP to not walk them, or a generator that yields the nodes to
+    # walk (receiving what each walk returned) if it needs to do something in
+    # between them.  Otherwise, all children are walked.
+    #
+    # leave(node) is called after the children have been walked, and returns
+    # the node to replace it with in its parent (None removes it from the
+    # parent).  The return value of leave() for the root is returned.
+    stack = []
+
+    node = root
+    while True:
+        r = enter(node) if enter else None
+
+        if type(r) is types.GeneratorType:
+            stack.append([node, r, 0, None])
+        elif r is not SKIP and node.children:
+            stack.append([node, None, 0, None])
+        else:
+            node = leave(node) if leave else node
+
+            if not stack:
+                return node
+
+        # Hand the result to the frame on top of the stack and find the next
+        # node to walk, leaving every frame that is done along the way.
+        result = node
+        node   = None
+        while node is None:
+            frame = stack[-1]
+            parent, gen, i, new_children = frame
+
+            if gen:
+                try:
+                    node = gen.send(result if i else None)
+                    frame[2] = 1
+                    continue
+                except StopIteration:
+                    pass
+            else:
+                children = parent.children
+
+                if i > 0 and new_children is None and result is not children[i-1]:
+                    # The first replaced child.  Copy the children before it.
+                    new_children = frame[3] = children[:i-1]
+
+                if new_children is not None and result is not None:
+                    new_children.append(result)
+
+                if i < len(children):
+                    node = children[i]
+                    frame[2] = i+1
+                    continue
+
+                if new_children is not None:
+                    parent.children = new_children
+
+            stack.pop()
+
+            result = leave(parent) if leave else parent
+            if not stack:
+                return result
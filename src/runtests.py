@@ -9,10 +9,17 @@ import time
 # Options used when compiling tests
 OPTS = [
     '--no-logo',
-    '--no-optim',
     '--no-warn'
 ]
 
+# The tests are compiled and run once with each of these options added.
+CONFIGS = [
+    ['--no-optim'],
+    [],
+    ['--deep-recursion'],
+    ['--indirection=call']
+]
+
 #-------------------------------------------------
 # SCRIPT
 #-------------------------------------------------
@@ -32,33 +39,48 @@ if __name__ == '__main__':
     start_time = time.time()
 
     d = os.getcwd()
-    for f in os.listdir(d):
-        if not f.endswith('.js'):
-            continue
+    for config in CONFIGS:
+        for f in os.listdir(d):
+            if not f.endswith('.js'):
+                continue
 
-        f2 = f[:-3]
-        f = os.path.join(d, f)
+            # Tests of optimizations could fail without them.
+            if f.startswith('opt.') and '--no-optim' in config:
+                continue
 
-        args = ['python', a]
-        args.extend(OPTS)
-        args.append(f)
+            f2 = f[:-3]
+            if config:
+                f2 += '(' + ' '.join(config) + ')'
 
-        print 'running test:', f2
-        if os.path.isfile(f + '.bat'):
-            os.remove(f + '.bat')
+            f = os.path.join(d, f)
 
-        subprocess.call(args)
+            args = ['python', a]
+            args.extend(OPTS)
+            args.extend(config)
+            args.append(f)
 
-        if os.path.isfile(f + '.bat'):
-            r = subprocess.call([f + '.bat', 'space in arg', '123abc'])
-            if r != 0:
-                failing.append(f2)
-            else:
-                passing.append(f2)
+            print 'running test:', f2
+            if os.path.isfile(f + '.bat'):
                 os.remove(f + '.bat')
-        else:
-            failing.append(f2)
-            print 'test {} failed to compile'.format(f2)
+
+            r = subprocess.call(args)
+
+            if f2.startswith('err.'):
+                # Errors have to be reported without crashing the compiler.
+                if r != 0 or os.path.isfile(f + '.bat'):
+                    failing.append(f2)
+                else:
+                    passing.append(f2)
+            elif os.path.isfile(f + '.bat'):
+                r = subprocess.call([f + '.bat', 'space in arg', '123abc'])
+                if r != 0:
+                    failing.append(f2)
+                else:
+                    passing.append(f2)
+                    os.remove(f + '.bat')
+            else:
+                failing.append(f2)
+                print 'test {} failed to compile'.format(f2)
 
     end_time = time.time()
     secs = end_time - start_time
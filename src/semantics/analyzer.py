@@ -2,10 +2,10 @@
 # IMPORTS
 #-------------------------------------------------
 
-from lexing.lexer    import Lexer
-from lexing.source   import StringSource
-from parsing.parser  import Parser
+import time
+
 from parsing.syntax  import *
+from parsing.walker  import SKIP, dispatch_table, walk
 from semantics.scope import Scope
 
 #-------------------------------------------------
@@ -18,14 +18,21 @@ PASS_2 = 2
 PASS_3 = 3
 PASS_4 = 4
 
+PASSES = (PASS_1, PASS_2, PASS_3, PASS_4)
+
+# Passes that need the previous passes to be done with the whole tree before
+# they can start.  Identifiers are resolved in the second pass, when all
+# functions (which can be used before they are declared) have been declared in
+# the first one.
+BARRIERS = (PASS_2,)
+
 #-------------------------------------------------
 # DECORATORS
 #-------------------------------------------------
 
 def analyzes(c, p):
     def decorator(func):
-        func._na_pass      = p
-        func._na_construct = c
+        func._na_key = (p, c)
 
         return func
 
@@ -36,24 +43,24 @@ def analyzes(c, p):
 #-------------------------------------------------
 
 class SemanticAnalyzer(object):
-    def __init__(self):
+    def __init__(self, modules):
         self.analyzer_funcs = {}
         self.includes = []
+        self.modules = modules
 
-        for s in dir(self):
-            func = getattr(self, s, None)
-            if not hasattr(func, '_na_construct'):
-                continue
-
-            p = func._na_pass
-            c = func._na_construct
-
+        for (p, c), func in dispatch_table(type(self), '_na_key').iteritems():
             if p not in self.analyzer_funcs:
                 self.analyzer_funcs[p] = {}
 
             self.analyzer_funcs[p][c] = func
 
-        self.cur_pass = 0
+        self.schedule = self.schedule_passes()
+        self.funcs = None
+
+        # Seconds spent in each walk, by the passes it ran.
+        self.timings = {}
+        self.nested_times = []
+
         self.global_scope = Scope()
         self.scope = self.global_scope
 
@@ -78,30 +85,62 @@ class SemanticAnalyzer(object):
 
         self.includes.append(s)
 
-        # FIXME: This crap needs to be cleaned up and moved into some other
-        # function in another file.
-        with open(s, 'r') as f:
-            source = StringSource(f.read())
-
-        lexer  = Lexer(source)
-        parser = Parser(lexer)
-
-        #mshl.trace('generating syntax tree...')
-        tree = parser.generate_ast()
+        # Already parsed when the module graph was loaded.
+        tree = self.modules.load(s).tree
 
         old_srcfile = mshl.srcfile
         mshl.srcfile = file_name
         self.verify_internal(tree)
         mshl.srcfile = old_srcfile
 
+    def schedule_passes(self):
+        # Returns the walks needed to run all passes, as a list of the passes
+        # run by each walk and the analyzer functions to call for them.  Passes
+        # without any analyzer functions are skipped altogether, and a pass is
+        # run in the same walk as the one before it unless it is a barrier or
+        # they have analyzer functions for the same construct.
+        schedule = []
+
+        for p in PASSES:
+            funcs = self.analyzer_funcs.get(p)
+            if not funcs:
+                continue
+
+            if schedule and p not in BARRIERS:
+                passes, fused = schedule[-1]
+                if not set(funcs) & set(fused):
+                    fused.update(funcs)
+                    schedule[-1] = (passes + (p,), fused)
+                    continue
+
+            schedule.append(((p,), dict(funcs)))
+
+        return schedule
+
     def verify_internal(self, node):
-        cur_pass = self.cur_pass
+        # Included files are verified in the middle of a walk.
+        funcs = self.funcs
+
+        for i, (passes, self.funcs) in enumerate(self.schedule):
+            self.nested_times.append(0.0)
+            start = time.time()
+
+            # Scopes are only entered and left in the first walk, so nodes only
+            # need to be told their scope once.
+            if i == 0:
+                walk(node, self.enter_node, self.leave_node)
+            else:
+                walk(node, self.enter_node)
 
-        for p in range(1, 5):
-            self.cur_pass = p
-            self.verify_single(node)
+            # Don't count time spent verifying includes twice.
+            elapsed = time.time() - start
+            nested  = self.nested_times.pop()
+            if self.nested_times:
+                self.nested_times[-1] += elapsed
 
-        self.cur_pass = cur_pass
+            self.timings[passes] = self.timings.get(passes, 0.0) + elapsed - nested
+
+        self.funcs = funcs
 
     def verify(self, ast):
         self.verify_internal(ast)
@@ -132,29 +171,20 @@ class SemanticAnalyzer(object):
         for nested in scope.nested_scopes:
             self.verify_scope(nested)
 
-    def verify_children(self, node):
-        if not node.children:
-            return
-
-        for child in node.children:
-            self.verify_single(child)
-
-    def verify_single(self, node):
-        p = self.cur_pass
-
-        r = False
-        if p in self.analyzer_funcs:
-            funcs = self.analyzer_funcs[p]
-            if node.construct in funcs:
-                funcs[node.construct](node)
-                r = True
-
-        if not r:
-            self.verify_children(node)
+    def enter_node(self, node):
+        # Analyzer functions are called before the children of the node are
+        # verified.  They can return SKIP to not verify them, or be generators
+        # yielding the children.
+        func = self.funcs.get(node.construct)
+        if func:
+            return func(self, node)
 
-        # Store scope for next pass.
+    def leave_node(self, node):
+        # Store scope for later passes.
         node.scope = self.scope
 
+        return node
+
     def enter_scope(self, name):
         self.scope = self.scope.nested_scope()
         self.scope.name = name
@@ -172,8 +202,6 @@ class SemanticAnalyzer(object):
         and a.construct != b.construct):
             mshl.warning('adding integer and string', node.token)
 
-        self.verify_children(node)
-
     @analyzes(ASSIGN, PASS_2)
     def __assign(self, node):
         if node.children[0].construct == IDENTIFIER:
@@ -187,8 +215,6 @@ class SemanticAnalyzer(object):
             var.writes += 1
             var.node = node
 
-        self.verify_children(node)
-
     @analyzes(FUNC, PASS_1)
     def __func(self, node):
         scope_name = None
@@ -230,7 +256,8 @@ class SemanticAnalyzer(object):
             # function is called.
             self.scope.decl_var(child.data, 'string').writes = 1
 
-        self.verify_children(node)
+        for child in node.children:
+            yield child
 
         self.leave_scope()
 
@@ -247,25 +274,25 @@ class SemanticAnalyzer(object):
             # Function name and a string is required.
             if len(node.children) != 2:
                 mshl.error('include() takes exactly one argument', node.token)
-                return
+                return SKIP
 
             if node.children[1].construct != STRING:
                 mshl.error('included file name must be a compile-time constant', node.token)
-                return
+                return SKIP
 
             file_name = node.children[1].data
 
             self.include(file_name)
 
-            return
+            return SKIP
         elif func_name == 'raw':
             if len(node.children) < 2 or len(node.children) > 3:
                 mshl.error('raw() takes one or two arguments', node.token)
-                return
+                return SKIP
 
             if node.children[1].construct != STRING:
                 mshl.error('raw command must be a compile-time constant', node.token)
-                return
+                return SKIP
 
             target = None
             if len(node.children) > 2:
@@ -279,8 +306,6 @@ class SemanticAnalyzer(object):
         if hasattr(func, 'num_args') and len(node.children) != func.num_args+1:
             mshl.warning('function {} takes {} arguments'.format(func_name, func.num_args), node.token)
 
-        self.verify_children(node)
-
     @analyzes(IDENTIFIER, PASS_2)
     def __identifier(self, node):
         var = node.scope.var(node.data)
@@ -303,8 +328,6 @@ class SemanticAnalyzer(object):
             elif int(a.data) > int(b.data):
                 mshl.warning('division will result in zero', node.token)
 
-        self.verify_children(node)
-
     @analyzes(MULTIPLY, PASS_1)
     def __multiply(self, node):
         a = node.children[0]
@@ -313,8 +336,6 @@ class SemanticAnalyzer(object):
         if a.construct == STRING or b.construct == STRING:
             mshl.error('multiplication only allowed with integers', node.token)
 
-        self.verify_children(node)
-
     @analyzes(SUBTRACT, PASS_1)
     def __subtract(self, node):
         a = node.children[0]
@@ -322,5 +343,3 @@ class SemanticAnalyzer(object):
 
         if a.construct == STRING or b.construct == STRING:
             mshl.error('subtraction only allowed with integers', node.token)
-
-        self.verify_children(node)
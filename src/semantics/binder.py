@@ -0,0 +1,212 @@
+#-------------------------------------------------
+# IMPORTS
+#-------------------------------------------------
+
+import mshl
+
+from parsing.syntax import *
+from parsing.walker import walk
+
+from .variable import STR
+
+#-------------------------------------------------
+# CONSTANTS
+#-------------------------------------------------
+
+# Kinds of symbols.
+FUNCTION  = 'function'
+PARAMETER = 'parameter'
+VARIABLE  = 'variable'
+
+#-------------------------------------------------
+# CLASSES
+#-------------------------------------------------
+
+class Symbol(object):
+    __slots__ = ('name', 'kind', 'depth', 'owner', 'slot', 'decl', 'type_',
+                 'returns', 'captured', 'reentrant', 'frame', 'tail_calls', 'deep')
+
+    def __init__(self, name, kind, depth, owner, slot=None):
+        self.name  = name
+        self.kind  = kind
+
+        # Number of functions the declaring scope is nested in, and the FUNC
+        # node of the declaring scope (None for the top level).
+        self.depth = depth
+        self.owner = owner
+
+        # Argument number of parameters.
+        self.slot = slot
+
+        # The node declaring the symbol: the first assignment to a variable,
+        # the FUNC node of a function or the identifier of a parameter.
+        self.decl = None
+
+        # Set by type inference: the type of the value (or for functions, the
+        # return value) of the symbol.
+        self.type_   = STR
+        self.returns = STR
+
+        # Set by capture analysis.  Whether a variable is used from functions
+        # nested in the one declaring it, and whether a function can be called
+        # again before returning and needs a frame.
+        self.captured  = False
+        self.reentrant = True
+        self.frame     = True
+
+        # Set by tail call elimination.  Whether a function calls itself as the
+        # last thing it does, which is done by jumping back to its start.
+        self.tail_calls = False
+
+        # Set by --deep-recursion.  Whether a function calls itself, which is
+        # done on a stack of environment variables if it can't be re-entered
+        # otherwise.
+        self.deep = False
+
+class Binding(object):
+    # What an identifier refers to.  hops is the number of functions out from
+    # where the identifier is used that the symbol is declared.
+    __slots__ = ('symbol', 'hops')
+
+    def __init__(self, symbol, hops):
+        self.symbol = symbol
+        self.hops   = hops
+
+class Binder(object):
+    # Resolves every identifier to the symbol it refers to and stores it on the
+    # node (node.binding), so that code generators never have to look names up
+    # in scopes.
+    #
+    # Variables are declared by their first assignment, in the scope of the
+    # function doing it, so nodes are bound in the order code is generated for
+    # them (i.e. the value of an assignment before the assigned identifier) and
+    # included files are bound where they are included.  This is done after
+    # optimization since removed assignments declare nothing.
+    #
+    # Symbols are kept in one table, mapping each name to the symbols with that
+    # name in the scopes we are in (innermost last), so a lookup is a single
+    # dict access no matter how deeply functions are nested.
+
+    def __init__(self, modules):
+        self.modules  = modules
+        self.includes = []
+
+        self.table  = {}
+        self.frames = [[]]
+        self.owners = [None]
+
+    def bind(self, tree):
+        walk(tree, self.enter_node)
+
+    def declare(self, name, kind, depth, slot=None):
+        symbol = Symbol(name, kind, depth, self.owners[depth], slot)
+
+        # Named functions are declared at the top level even when we're in a
+        # nested scope, so the symbol goes below those of inner scopes.
+        symbols = self.table.setdefault(name, [])
+        i = len(symbols)
+        while i > 0 and symbols[i-1].depth > depth:
+            i -= 1
+
+        if i > 0 and symbols[i-1].depth == depth:
+            symbols[i-1] = symbol
+        else:
+            symbols.insert(i, symbol)
+            self.frames[depth].append(name)
+
+        return symbol
+
+    def resolve(self, node):
+        symbols = self.table.get(node.data)
+        if not symbols:
+            mshl.error('identifier used before it is declared: {}'.format(node.data), node.token)
+            return
+
+        symbol = symbols[-1]
+        node.binding = Binding(symbol, len(self.frames) - 1 - symbol.depth)
+
+    def enter_scope(self, owner):
+        self.frames.append([])
+        self.owners.append(owner)
+
+    def leave_scope(self):
+        for name in self.frames.pop():
+            self.table[name].pop()
+
+        self.owners.pop()
+
+    def enter_node(self, node):
+        c = node.construct
+
+        if c == IDENTIFIER:
+            self.resolve(node)
+        elif c == ASSIGN:
+            return self.bind_assign(node)
+        elif c == FOR:
+            return self.bind_for(node)
+        elif c == FUNC:
+            return self.bind_func(node)
+        elif c == FUNC_CALL:
+            return self.bind_func_call(node)
+
+    def bind_assign(self, node):
+        ident = node.children[0]
+
+        yield node.children[1]
+
+        if ident.construct != IDENTIFIER:
+            yield ident
+        elif self.table.get(ident.data):
+            self.resolve(ident)
+        else:
+            symbol = self.declare(ident.data, VARIABLE, len(self.frames) - 1)
+            symbol.decl = node
+            ident.binding = Binding(symbol, 0)
+
+    def bind_for(self, node):
+        # The loop expression comes after the body.
+        yield node.children[0]
+        yield node.children[1]
+
+        for child in node.children[3:]:
+            yield child
+
+        yield node.children[2]
+
+    def bind_func(self, node):
+        if node.data:
+            symbol = self.declare(node.data, FUNCTION, 0)
+            symbol.decl = node
+            node.binding = Binding(symbol, len(self.frames) - 1)
+
+        self.enter_scope(node)
+
+        depth = len(self.frames) - 1
+
+        # Start from 4 since first 3 args are reserved for impl.
+        for i, param in enumerate(node.children[0].children):
+            symbol = self.declare(param.data, PARAMETER, depth, i+4)
+            symbol.decl = param
+            param.binding = Binding(symbol, 0)
+
+        for child in node.children[1].children:
+            yield child
+
+        self.leave_scope()
+
+    def bind_func_call(self, node):
+        func = node.children[0]
+
+        if func.construct == IDENTIFIER and func.data == 'include':
+            s = mshl.find_include_file(node.children[1].data)
+            if s not in self.includes:
+                self.includes.append(s)
+                yield self.modules.load(s).tree
+
+            return
+
+        if func.construct == IDENTIFIER and func.data == 'raw':
+            return
+
+        for child in node.children:
+            yield child
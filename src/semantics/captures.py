@@ -0,0 +1,145 @@
+#-------------------------------------------------
+# IMPORTS
+#-------------------------------------------------
+
+from parsing.syntax import *
+from parsing.walker import walk
+
+from .binder    import FUNCTION, VARIABLE
+from .inference import BODIES, direct_callee
+
+#-------------------------------------------------
+# CLASSES
+#-------------------------------------------------
+
+class CaptureAnalysis(object):
+    # Finds the variables that are captured by closures, i.e. used from inside
+    # functions nested in the one declaring them, and the named functions that
+    # can be called again before they have returned.
+    #
+    # Captured variables (symbol.captured) have to live in the frame of the
+    # call declaring them, where closures find them by following the chain of
+    # frames.  Other variables of functions that can't be re-entered
+    # (symbol.reentrant) don't, and can be kept in plain variables, as can all
+    # top-level variables since the top level runs once.  Named functions only
+    # set up their frame (symbol.frame) if a chain starts or passes through it.
+
+    def __init__(self):
+        # The functions we are in, innermost last (None is the top level).
+        self.funcs = [None]
+
+        # The symbols of the named functions called by each function (None for
+        # calls through anything but the name of a function).
+        self.calls = {}
+
+        self.named     = {}
+        self.anonymous = []
+        self.escaped   = set()
+        self.frames    = set()
+
+    def analyze(self, trees):
+        for tree in trees:
+            walk(tree, self.enter_node)
+
+        for symbol, func in self.named.items():
+            symbol.reentrant = func in self.reachable(func)
+            symbol.frame     = func in self.frames
+
+    def callees(self, func):
+        # The functions that a call to the specified one can lead to directly.
+        # None stands for the functions called through anything but their name,
+        # which could be any function that has been used as a value.
+        if func is None:
+            callees = [self.named[s] for s in self.escaped if s in self.named]
+            callees.extend(self.anonymous)
+            return callees
+
+        return [self.named.get(symbol) for symbol in self.calls[func]
+                if symbol is None or symbol in self.named]
+
+    def reachable(self, func):
+        # The functions that can be called while the specified one runs.
+        visited = set()
+
+        stack = self.callees(func)
+        while stack:
+            f = stack.pop()
+            if f in visited:
+                continue
+
+            visited.add(f)
+            stack.extend(self.callees(f))
+
+        return visited
+
+    def enter_node(self, node):
+        c = node.construct
+
+        if node.children and c not in BODIES:
+            for child in node.children:
+                if child.construct == FUNC and child.binding:
+                    self.escaped.add(child.binding.symbol)
+
+        if c == IDENTIFIER:
+            self.capture(node)
+        elif c == FUNC:
+            return self.enter_func(node)
+        elif c == FUNC_CALL:
+            return self.enter_func_call(node)
+
+    def capture(self, node):
+        binding = node.binding
+        if not binding:
+            return
+
+        symbol = binding.symbol
+        if symbol.kind == FUNCTION:
+            # Not the name of a called function, so it's used as a value.
+            self.escaped.add(symbol)
+            return
+
+        if symbol.kind != VARIABLE or binding.hops == 0 or not symbol.owner:
+            return
+
+        symbol.captured = True
+
+        # The chain of frames is followed from here out to the owner.
+        for func in self.funcs[-binding.hops:]:
+            if func.binding:
+                self.frames.add(func)
+
+    def enter_func(self, node):
+        self.calls[node] = []
+
+        if node.binding:
+            self.named[node.binding.symbol] = node
+        else:
+            self.anonymous.append(node)
+
+        self.funcs.append(node)
+
+        for child in node.children[1].children:
+            yield child
+
+        self.funcs.pop()
+
+    def enter_func_call(self, node):
+        func = node.children[0]
+        if func.construct == IDENTIFIER and func.data in ('include', 'raw'):
+            return
+
+        callee = direct_callee(node)
+
+        # Tail calls jump back to the start of the calling function, which is
+        # done with its variables by then, and deep recursion saves them.
+        caller = self.funcs[-1]
+        if caller and not node.is_tail_call and not (callee and callee.deep and
+                                                     caller.binding and
+                                                     caller.binding.symbol is callee):
+            self.calls[caller].append(callee)
+
+        if not callee:
+            yield func
+
+        for arg in node.children[1:]:
+            yield arg
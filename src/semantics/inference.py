@@ -0,0 +1,260 @@
+#-------------------------------------------------
+# IMPORTS
+#-------------------------------------------------
+
+from parsing.syntax import *
+from parsing.walker import SKIP, walk
+
+from .binder   import FUNCTION
+from .variable import INT, STR
+
+#-------------------------------------------------
+# CONSTANTS
+#-------------------------------------------------
+
+# Constructs that evaluate to an integer no matter what their operands are.
+INT_CONSTRUCTS = frozenset((
+    BIN_AND, BIN_OR, BIN_XOR, DEC, DIVIDE, EQUAL, EQUAL_UNDEF, GREATER,
+    GREATER_EQ, INC, INTEGER, LESS, LESS_EQ, LOGIC_AND, LOGIC_OR, MODULO,
+    MULTIPLY, NOT_EQ, NOT_EQ_UNDEF, SHIFT_L, SHIFT_R, SUBTRACT
+))
+
+# Constructs whose children are statements rather than values.
+BODIES = frozenset((ELSE, FOR, FUNC_DEF, PROGRAM, THEN, WHILE))
+
+#-------------------------------------------------
+# FUNCTIONS
+#-------------------------------------------------
+
+def join(a, b):
+    # Types are ordered None (nothing known yet) < INT < STR, since a value
+    # that is sometimes a string has to be treated as one.
+    if a is None:
+        return b
+
+    if b is None or a == b:
+        return a
+
+    return STR
+
+def combine(a, b):
+    # The type of a value computed from two others (a + b, c ? a : b), which
+    # is only known once both are.
+    if STR in (a, b):
+        return STR
+
+    if a is None or b is None:
+        return None
+
+    return INT
+
+def direct_callee(node):
+    # The symbol of the named function called by a call node, if any.
+    func = node.children[0]
+    if func.construct != IDENTIFIER or not func.binding:
+        return None
+
+    symbol = func.binding.symbol
+    if symbol.kind != FUNCTION:
+        return None
+
+    return symbol
+
+def always_returns(body):
+    # Whether a list of statements can't run to its end: the last one returns,
+    # or is an if statement whose branches both always return.
+    if not body.children:
+        return False
+
+    node = body.children[-1]
+    if node.construct == RETURN:
+        return True
+
+    if node.construct == IF:
+        return always_returns(node.children[1]) and always_returns(node.children[2])
+
+    return False
+
+#-------------------------------------------------
+# CLASSES
+#-------------------------------------------------
+
+class TypeInference(object):
+    # Infers whether variables, parameters and the return values of named
+    # functions always hold integers (INT) or may hold strings (STR), and
+    # stores it on their symbols (symbol.type_ and symbol.returns), so the code
+    # generator can use integer instructions for them.
+    #
+    # Types flow from values into the variables they are assigned to, from
+    # arguments into the parameters of the functions they are passed to and
+    # from return statements into the calls, over and over until nothing
+    # changes.  Values are typed the same way as by the code generator, and
+    # what we can't follow (properties, functions called through anything but
+    # their name) is a string, just as it was before there was inference.
+
+    def __init__(self):
+        # The expressions assigned to each symbol, the arguments of the calls
+        # to each named function and the expressions returned by them.
+        self.assigns = []
+        self.calls   = []
+        self.returns = []
+
+        # The parameter symbols of each named function, and the functions that
+        # are used as values and so can be called from anywhere.
+        self.params  = {}
+        self.escaped = set()
+
+        self.funcs = []
+
+        self.types   = {}
+        self.results = {}
+
+        self.value_stack = []
+
+    def infer(self, trees):
+        for tree in trees:
+            walk(tree, self.enter_node)
+
+        for func in self.escaped:
+            self.results[func] = STR
+            for param in self.params.get(func, ()):
+                self.types[param] = STR
+
+        changed = True
+        while changed:
+            changed = False
+
+            for symbol, expr in self.assigns:
+                changed |= self.refine(self.types, symbol, self.type_of(expr))
+
+            for func, args in self.calls:
+                params = self.params.get(func, ())
+                for i, param in enumerate(params):
+                    # Missing arguments are empty strings.
+                    type_ = self.type_of(args[i]) if i < len(args) else STR
+                    changed |= self.refine(self.types, param, type_)
+
+            for func, expr in self.returns:
+                changed |= self.refine(self.results, func, self.type_of(expr))
+
+        for symbol, _ in self.assigns:
+            symbol.type_ = self.types.get(symbol) or STR
+
+        for func, params in self.params.items():
+            func.returns = self.results.get(func) or STR
+            for param in params:
+                param.type_ = self.types.get(param) or STR
+
+    def refine(self, types, symbol, type_):
+        old_type = types.get(symbol)
+        types[symbol] = join(old_type, type_)
+
+        return types[symbol] != old_type
+
+    def enter_node(self, node):
+        c = node.construct
+
+        if node.children and c not in BODIES:
+            for child in node.children:
+                if child.construct == FUNC and child.binding:
+                    self.escaped.add(child.binding.symbol)
+
+        if c == IDENTIFIER:
+            if node.binding and node.binding.symbol.kind == FUNCTION:
+                self.escaped.add(node.binding.symbol)
+        elif c == ASSIGN:
+            ident = node.children[0]
+            if ident.construct == IDENTIFIER and ident.binding:
+                self.assigns.append((ident.binding.symbol, node.children[1]))
+        elif c in (INC, DEC):
+            ident = node.children[0]
+            if ident.construct == IDENTIFIER and ident.binding:
+                self.assigns.append((ident.binding.symbol, node))
+        elif c == FUNC:
+            return self.enter_func(node)
+        elif c == FUNC_CALL:
+            return self.enter_func_call(node)
+        elif c == RETURN:
+            func = self.funcs[-1] if self.funcs else None
+            if func and func.binding:
+                self.returns.append((func.binding.symbol, node.children[0]))
+
+    def enter_func(self, node):
+        body = node.children[1]
+
+        if node.binding:
+            symbol = node.binding.symbol
+            self.params[symbol] = [param.binding.symbol for param in node.children[0].children]
+
+            # Falling off the end of a function returns zero.
+            if not always_returns(body):
+                self.results[symbol] = INT
+
+        self.funcs.append(node)
+
+        for child in body.children:
+            yield child
+
+        self.funcs.pop()
+
+    def enter_func_call(self, node):
+        func = node.children[0]
+        if func.construct == IDENTIFIER and func.data == 'raw':
+            # Raw code can return anything.
+            if self.funcs and self.funcs[-1].binding:
+                self.results[self.funcs[-1].binding.symbol] = STR
+            return
+
+        if func.construct == IDENTIFIER and func.data == 'include':
+            return
+
+        callee = direct_callee(node)
+        if callee:
+            self.calls.append((callee, node.children[1:]))
+        else:
+            yield func
+
+        for arg in node.children[1:]:
+            yield arg
+
+    def type_of(self, expr):
+        walk(expr, self.enter_expr, self.leave_expr)
+
+        return self.value_stack.pop()
+
+    def enter_expr(self, node):
+        c = node.construct
+
+        if c == ADD:
+            return
+        elif c == IF_TERNARY:
+            return self.enter_if_ternary(node)
+
+        return SKIP
+
+    def enter_if_ternary(self, node):
+        # The condition doesn't affect the type.
+        yield node.children[1]
+        yield node.children[2]
+
+    def leave_expr(self, node):
+        c = node.construct
+
+        if c in (ADD, IF_TERNARY):
+            b = self.value_stack.pop()
+            a = self.value_stack.pop()
+            type_ = combine(a, b)
+        elif c in INT_CONSTRUCTS:
+            type_ = INT
+        elif c == IDENTIFIER and node.binding:
+            symbol = node.binding.symbol
+            type_ = STR if symbol.kind == FUNCTION else self.types.get(symbol)
+        elif c == FUNC_CALL:
+            callee = direct_callee(node)
+            type_ = self.results.get(callee) if callee else STR
+        else:
+            type_ = STR
+
+        self.value_stack.append(type_)
+
+        return node
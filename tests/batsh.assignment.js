@@ -7,10 +7,10 @@ include('assert.js')
  */
 
 a = "Value: " + 1+(4+6)*3;
-assert.equal(a, 'Value: 31', '')
+assert.equal(a, 'Value: 130', '')
 b = 3 + 4;
 assert.equal(b, 7, '')
 c = a;
-assert.equal(c, 'Value: 31', '')
+assert.equal(c, 'Value: 130', '')
 d = b + c;
-assert.equal(d, '7Value: 31', '')
+assert.equal(d, '7Value: 130', '')
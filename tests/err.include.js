@@ -0,0 +1,2 @@
+// Errors in included files are reported too.
+include('err.syntax.js')
@@ -0,0 +1,3 @@
+// The parser leaves parts it can't parse out of the tree.
+if (1 {
+}
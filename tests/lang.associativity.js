@@ -42,4 +42,13 @@ assert.equal(q[0], 2, 'post-increment failed for array indexer')
 q[0]--
 assert.equal(q[0], 1, 'post-decrement failed for array indexer')
 
+r = 10 - 2 - 3
+assert.equal(r, 5, 'associativity for - is wrong')
+s = 100 / 10 / 5
+assert.equal(s, 2, 'associativity for / is wrong')
+t = 'a' + 1 + 2
+assert.equal(t, 'a12', 'associativity for string + is wrong')
+u = 1 + 2 == 3
+assert.isTrue(u, 'precedence for + and == is wrong')
+
 // TODO: Test associativity of more operators here.
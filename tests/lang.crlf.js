@@ -0,0 +1,18 @@
+include('assert.js')
+
+// This file has CRLF line endings, which have to work like LF ones.
+a = 'first' // Comments end at the end of the line.
+b = 'second'
+
+/* Comments can span
+   several lines. */
+c = a +
+    ' ' + b
+
+function d(x,
+           y) {
+    return x * y
+}
+
+assert.equal(c, 'first second', 'statements did not end at CRLF line endings')
+assert.equal(d(6, 7), 42, 'function spanning CRLF lines gave incorrect result')
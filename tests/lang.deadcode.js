@@ -0,0 +1,61 @@
+include('assert.js')
+
+// Branches and loops with known conditions, and statements after return,
+// break and continue, are removed when optimizing.  What they declare for
+// the code that is kept has to stay.
+DEBUG = 0
+
+if (DEBUG) {
+    assert.isTrue(false, 'branch with false condition was run')
+}
+
+if (!DEBUG) {
+    a = 'live'
+} else {
+    assert.isTrue(false, 'else branch with true condition was run')
+}
+
+assert.equal(a, 'live', 'branch with true condition was not run')
+
+while (DEBUG) {
+    assert.isTrue(false, 'loop with false condition was run')
+}
+
+for (i = 5; DEBUG; i++) {
+    assert.isTrue(false, 'for loop with false condition was run')
+}
+
+assert.equal(i, 5, 'init of for loop with false condition was not run')
+
+if (DEBUG) {
+    b = 'dead'
+}
+
+assert.equal(b, '', 'variable declared in dead branch was set')
+
+function c(x) {
+    if (x) {
+        return 'yes'
+    } else {
+        return 'no'
+    }
+
+    assert.isTrue(false, 'statement after if returning in both branches was run')
+}
+
+assert.equal(c(1), 'yes', 'c(1) should return yes')
+assert.equal(c(0), 'no' , 'c(0) should return no')
+
+n = 0
+while (1) {
+    n++
+    if (n < 3) {
+        continue
+        assert.isTrue(false, 'statement after continue was run')
+    }
+
+    break
+    assert.isTrue(false, 'statement after break was run')
+}
+
+assert.equal(n, 3, 'loop with break and continue ran the wrong number of times')
@@ -0,0 +1,38 @@
+include('assert.js')
+
+// Fields, functions and the variables of outer functions are looked up by
+// name, with --indirection deciding how.
+a = []
+a['some key'] = 'spaced'
+a[3] = 'three'
+a['what?'] = 'wildcard'
+
+k = 'some key'
+assert.equal(a[k]      , 'spaced'  , 'key with a space could not be read')
+assert.equal(a[1 + 2]  , 'three'   , 'computed index could not be read')
+assert.equal(a['what?'], 'wildcard', 'key with a wildcard could not be read')
+
+a.twice = function (s) {
+    return s + s
+}
+
+assert.equal(a.twice('ab'), 'abab', 'function in field could not be called')
+
+function outer() {
+    x = 'outer'
+
+    middle = function () {
+        y = 'middle'
+
+        inner = function () {
+            x = x + 's'
+            return x + ' ' + y
+        }
+
+        return inner()
+    }
+
+    return middle()
+}
+
+assert.equal(outer(), 'outers middle', 'variables of outer functions could not be used')
@@ -0,0 +1,44 @@
+include('assert.js')
+
+// Small functions returning an expression are inlined when optimizing.
+// Inlined calls have to behave like the calls they replace.
+function square(x) {
+    return x * x
+}
+
+function add(a, b) {
+    return a + b
+}
+
+function join(s, t) {
+    return s + t
+}
+
+function double(x) {
+    return x * 2
+}
+
+function twice(f, x) {
+    return f(f(x))
+}
+
+assert.equal(square(7)          , 49 , 'square of 7 should be 49')
+assert.equal(add(2, 3)          , 5  , 'sum of 2 and 3 should be 5')
+assert.equal(square(add(1, 2))  , 9  , 'nested inlined calls gave incorrect result')
+assert.equal(join('ab', 'cd')   , 'abcd', 'join should concatenate strings')
+assert.equal(join('ab')         , 'ab'  , 'missing argument should be empty')
+
+// Arguments with side effects are evaluated once.
+n = 3
+assert.equal(square(n++), 9, 'square of n++ should be 9')
+assert.equal(n, 4, 'n++ should have been evaluated once')
+
+// Functions used as values are still called.
+assert.equal(double(5)         , 10, 'double of 5 should be 10')
+assert.equal(twice(double, 3)  , 12, 'doubling 3 twice should give 12')
+
+function fact(k) {
+    return k < 2 ? 1 : k * fact(k - 1)
+}
+
+assert.equal(fact(5), 120, 'factorial of 5 should be 120')
@@ -0,0 +1,21 @@
+include('assert.js')
+
+// Methods that are never used are removed when optimizing.  Those that could
+// be used through computed property names have to stay.
+obj = []
+obj.greet = function () {
+    return 'hi'
+}
+
+obj.part = function () {
+    return 'bye'
+}
+
+function call(o, name) {
+    return o[name]()
+}
+
+assert.equal(call(obj, 'greet'), 'hi', 'method with computed name could not be called')
+
+k = 'part'
+assert.equal(obj[k](), 'bye', 'method with constant name could not be called')
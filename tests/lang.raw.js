@@ -1,4 +1,10 @@
 include('assert.js')
 
+// Raw code can use variables by their generated names.
+s = 'abc'
+t = ''
+raw('set "__c_0__.t=!__c_0__.s!"', 'bat')
+assert.equal(t, s, 'raw code could not read variable s')
+
 raw('goto :eof', 'bat')
 assert.isTrue(false, 'raw did not work properly')
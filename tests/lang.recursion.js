@@ -0,0 +1,68 @@
+include('assert.js')
+
+// Recursive calls are jumps with the variables of the call saved on a stack
+// with --deep-recursion.  Variables have to have their values back after
+// each call.
+function sum(n) {
+    if (n == 0) {
+        return 0
+    }
+
+    x = n
+    s = sum(n - 1)
+    return s + x
+}
+
+assert.equal(sum(200), 20100, 'sum of 1 to 200 should be 20100')
+
+function depth(n) {
+    d = 0
+    while (d < 2) {
+        d = d + 1
+    }
+
+    if (n > 0) {
+        depth(n - 1)
+    }
+
+    return d
+}
+
+assert.equal(depth(50), 2, 'local var d lost its value in recursion')
+
+function count(a, i) {
+    if (i >= a.length) {
+        return 0
+    }
+
+    k = a[i] > 2 ? 1 : 0
+    return k + count(a, i + 1)
+}
+
+assert.equal(count([1, 3, 5, 2, 4], 0), 3, 'count should be 3')
+
+// Functions with closures are called as usual.
+function adders(n) {
+    if (n == 0) {
+        return 0
+    }
+
+    m = n
+    add = function (x) {
+        return 1*x + 1*m
+    }
+
+    return add(adders(n - 1))
+}
+
+assert.equal(adders(20), 210, 'adders of 20 should be 210')
+
+function tree(n) {
+    if (n < 2) {
+        return n
+    }
+
+    return tree(n - 1) + tree(n - 2)
+}
+
+assert.equal(tree(12), 144, 'tree of 12 should be 144')
@@ -18,3 +18,15 @@ function b() {
 }
 
 b()
+
+// Test that local vars don't keep their values between calls.
+function e(set) {
+    if (set) {
+        f = 'set'
+    }
+
+    return f
+}
+
+assert.equal(e(1), 'set', 'could not set local var f')
+assert.equal(e(0), '', 'local var f kept its value from the last call')
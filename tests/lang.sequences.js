@@ -0,0 +1,64 @@
+include('assert.js')
+
+// Consecutive statements are merged into fewer lines when optimizing.  Each
+// statement has to see what the ones before it did.
+function steps(n) {
+    a = n + 1
+    b = a * 2
+    c = n - 1
+    d = b + c
+    return d
+}
+
+assert.equal(steps(5), 16, 'steps of 5 should be 16')
+
+function swap(m, n) {
+    p = m * 1
+    q = n * 1
+    t = p
+    p = q
+    q = t
+    return p * 10 + q
+}
+
+assert.equal(swap(1, 2), 21, 'swap of 1 and 2 should give 21')
+
+function increments(n) {
+    i = n * 1
+    j = i++
+    k = i++
+    return j * 100 + k * 10 + i
+}
+
+assert.equal(increments(1), 123, 'increments of 1 should give 123')
+
+function copies(n) {
+    x = n * 1
+    y = x
+    x = 5
+    return y
+}
+
+assert.equal(copies(7), 7, 'copy of x changed with x')
+
+// Jumps and the code after them.
+function loops(n) {
+    r = 0
+    for (i = 0; i < n; i++) {
+        for (j = 0; j < n; j++) {
+            if (j > i) {
+                break
+            }
+
+            r++
+        }
+
+        if (r > 100) {
+            return 0 - 1
+        }
+    }
+
+    return r
+}
+
+assert.equal(loops(4), 10, 'loops of 4 should give 10')
@@ -0,0 +1,30 @@
+include('assert.js')
+
+// Constants are put in place of variables and folded when optimizing, which
+// has to give the same results as set /a.
+W = 6
+H = 7
+AREA = W * H
+assert.equal(AREA, 42, 'constant multiplication gave incorrect result')
+
+a = 2147483647
+assert.equal(a+1    , 0-2147483647-1, 'addition should wrap around')
+assert.equal(a*2    , 0-2           , 'multiplication should wrap around')
+assert.equal(65536*65536, 0         , 'multiplication should wrap to zero')
+assert.equal(1<<31  , 0-2147483647-1, 'left-shift should wrap around')
+assert.equal(0-a-2  , 2147483647    , 'subtraction should wrap around')
+
+b = -7
+assert.equal(b/2    , -3, 'division should round towards zero')
+assert.equal(b%2    , -1, 'modulo should have the sign of the dividend')
+assert.equal(7/(0-2), -3, 'division by negative should round towards zero')
+assert.equal(7%(0-2), 1 , 'modulo by negative should be positive')
+assert.equal(b>>1   , -4, 'right-shift should keep the sign')
+
+c = 'abc'
+d = c + 'def'
+assert.equal(d, 'abcdef', 'constant concatenation gave incorrect result')
+
+assert.isTrue (W < H && AREA == 42, 'constant comparisons gave incorrect result')
+assert.isFalse(W > H || AREA != 42, 'constant comparisons gave incorrect result')
+assert.equal(W < H ? 'yes' : 'no', 'yes', 'constant ternary gave incorrect result')
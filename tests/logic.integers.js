@@ -27,3 +27,15 @@ assert.isTrue (d != e, 'd should be unequal to e')
 assert.isFalse(d >  e, 'd should not be greater than e')
 assert.isFalse(d >= e, 'd should not be greater than or equal to e')
 assert.isFalse(d == e, 'd should not be equal to e')
+
+// Integer variables can be compared before they are assigned.
+function f(set) {
+    if (set) {
+        g = 5
+    }
+
+    return g == 5
+}
+
+assert.isTrue (f(1), 'g should be equal to 5 once assigned')
+assert.isFalse(f(0), 'unassigned g should not be equal to 5')
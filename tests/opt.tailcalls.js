@@ -0,0 +1,46 @@
+include('assert.js')
+
+// Tail calls are jumps when optimizing, so they can recurse deeper than cmd
+// could nest calls.
+function count(n, acc) {
+    if (n == 0) {
+        return acc
+    }
+
+    return count(n - 1, acc + 2)
+}
+
+assert.equal(count(10000, 0), 20000, 'count of 10000 should be 20000')
+
+// Arguments reading parameters are evaluated before any are set.
+function gcd(a, b) {
+    if (b == 0) {
+        return a
+    }
+
+    return gcd(b, a % b)
+}
+
+assert.equal(gcd(1071, 462), 21, 'gcd of 1071 and 462 should be 21')
+
+function swap(a, b, n) {
+    if (n == 0) {
+        return a + '' + b
+    }
+
+    return swap(b, a, n - 1)
+}
+
+assert.equal(swap('x', 'y', 3), 'yx', 'swapping three times should give yx')
+
+// Calls that are the last statement are tail calls too.
+total = 0
+function add(n) {
+    if (n > 0) {
+        total = total + n
+        add(n - 1)
+    }
+}
+
+add(5000)
+assert.equal(total, 12502500, 'sum of 1 to 5000 should be 12502500')